@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import importlib
+import multiprocessing
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+from app import metrics
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _timed(fn: Callable, args: tuple) -> Tuple[Any, float, float]:
+    # wall-clock so the timestamps stay comparable across processes
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def _timed_remote(fn: Callable, args: tuple, trace: bool) -> Tuple[Any, float, float, tuple]:
+    # histograms and the stage trace live in this worker; send them back with
+    # the result so the API process's /metrics and Server-Timing include them
+    metrics.ship()
+    token = metrics.start_trace() if trace else None
+    result, started, finished = _timed(fn, args)
+    stages = metrics.end_trace(token) if token is not None else []
+    return result, started, finished, metrics.drain() + (stages,)
+
+
+def _collect(gen_fn: Callable, args: tuple) -> list:
+    return list(gen_fn(*args))
+
+
+def warm_module(module: str) -> None:
+    """Process-pool initializer: run `module.warmup()` in the new worker."""
+    importlib.import_module(module).warmup()
+
+
+_DONE = object()
+
+
+class InferenceExecutor:
+    """Bounded pool for CPU-heavy quiz generation.
+
+    At most `workers` jobs run at once and at most `max_queue` more wait;
+    anything beyond that is rejected with QueueFullError instead of piling
+    up on the event loop's default threadpool. A process pool given a
+    `warmup_module` loads that module's models in every worker as it starts.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, kind: str = "thread", warmup_module: Optional[str] = None):
+        if kind == "process":
+            init = (warm_module, (warmup_module,)) if warmup_module else (None, ())
+            # spawn, not fork: the parent holds open SQLite connections (session
+            # store, generation cache) that must not be shared with a child
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=init[0], initargs=init[1]
+            )
+        else:
+            kind = "thread"
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.inflight - self.workers)
+
+    def warm(self, poll: float = 0.05) -> None:
+        """Block until every process worker has started and run its initializer.
+
+        A worker only takes jobs once its initializer returns, so the pool is
+        warm when `workers` distinct pids have answered a ping.
+        """
+        if self.kind != "process":
+            return
+        pids = set()
+        while len(pids) < self.workers:
+            futures = [self._pool.submit(os.getpid) for _ in range(self.workers)]
+            pids.update(f.result() for f in futures)
+            if len(pids) < self.workers:
+                time.sleep(poll)
+
+    async def run(self, fn: Callable, *args) -> Tuple[Any, Dict[str, float]]:
+        with self._lock:
+            if self.inflight >= self.workers + self.max_queue:
+                raise QueueFullError("Inference queue is full")
+            self.inflight += 1
+            depth = self.queued
+
+        enqueued = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # carry the request's context (stage trace) into the worker
+                call = (contextvars.copy_context().run, _timed, fn, args)
+                result, started, finished = await loop.run_in_executor(self._pool, *call)
+            else:
+                result, started, finished, shipped = await loop.run_in_executor(self._pool, _timed_remote, fn, args, metrics.tracing())
+                metrics.merge(*shipped)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+        return result, {
+            "queue_depth": depth,
+            "queue_wait": max(0.0, started - enqueued),
+            "service_time": finished - started,
+        }
+
+    async def stream(self, gen_fn: Callable, *args, retry_delay: float = 0.05) -> AsyncIterator[Any]:
+        """Drive a generator on the pool, yielding items as they are produced.
+
+        Each step is a separate job, so long batches share the pool fairly.
+        Only the first step can raise QueueFullError; later steps wait for a
+        free slot instead of aborting a response that has already started.
+        Process pools cannot resume a generator remotely, so there the whole
+        generator runs as one job.
+        """
+        if self.kind == "process":
+            items, _ = await self.run(_collect, gen_fn, args)
+            for item in items:
+                yield item
+            return
+
+        gen = gen_fn(*args)
+        first = True
+        while True:
+            try:
+                item, _ = await self.run(next, gen, _DONE)
+            except QueueFullError:
+                if first:
+                    raise
+                await asyncio.sleep(retry_delay)
+                continue
+            first = False
+            if item is _DONE:
+                return
+            yield item
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -5,16 +5,22 @@
 import os
 import json
 import logging
+import secrets
 import time
+import threading
 from typing import List, Optional
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field, ValidationError
 
+from app import metrics
+from app.executor import InferenceExecutor, QueueFullError
+from app.response_cache import ResponseCache, etag_matches
+
 # ──────────────────────────
 # Logging Configuration (define FIRST!)
 # ──────────────────────────
@@ -44,6 +50,25 @@ def load_config() -> dict:
 raw_cfg = load_config()
 
 
+class InferenceConfig(BaseModel):
+    executor: str = "thread"  # "thread" or "process"
+    workers: int = Field(2, ge=1)
+    max_queue: int = Field(16, ge=0)
+    retry_after: int = Field(1, ge=0)
+
+
+class MetricsConfig(BaseModel):
+    enabled: bool = True
+    # clients opt in per request with "X-Server-Timing: 1"
+    server_timing: bool = True
+
+
+class ResponseCacheConfig(BaseModel):
+    # seeded requests only; unseeded quizzes are random by design
+    enabled: bool = True
+    max_size: int = Field(1024, ge=0)
+
+
 class AppConfig(BaseModel):
     generator_mode: str
     model_supported_goals: List[str]
@@ -51,9 +76,17 @@ class AppConfig(BaseModel):
     supported_difficulties: List[str]
     default_num_questions: int = Field(5, ge=1)
     max_questions: int = Field(10, ge=1)
+    max_batch_quizzes: int = Field(50, ge=1)
+    warmup_on_start: bool = True
+    # /admin/* is disabled (404) until set; then required as X-Admin-Token
+    admin_token: Optional[str] = None
+    inference: InferenceConfig = InferenceConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    response_cache: ResponseCacheConfig = ResponseCacheConfig()
 
 
 config = AppConfig(**raw_cfg)
+metrics.configure(config.metrics.enabled)
 
 if config.generator_mode not in ("model", "retrieval"):
     logger.error("Invalid generator_mode in config: %s", config.generator_mode)
@@ -66,6 +99,10 @@ class MCQRequest(BaseModel):
     goal: str
     difficulty: str
     num_questions: int = Field(config.default_num_questions, gt=0)
+    # repeat quizzes with the same session_id skip questions already served
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
+    # same seed, same quiz; seeded responses are cached and carry an ETag
+    seed: Optional[int] = None
 
 
 class QuestionItem(BaseModel):
@@ -85,6 +122,10 @@ class QuizResponse(BaseModel):
     difficulty: str
     questions: List[QuestionItem]
 
+
+class BatchRequest(BaseModel):
+    quizzes: List[MCQRequest] = Field(..., min_length=1)
+
 # ──────────────────────────
 # FastAPI App Setup
 # ──────────────────────────
@@ -111,9 +152,23 @@ def health_check():
 @app.middleware("http")
 async def add_timing_header(request, call_next):
     start = time.perf_counter()
-    response = await call_next(request)
+    timing = config.metrics.enabled and config.metrics.server_timing and request.headers.get("x-server-timing") == "1"
+    token = metrics.start_trace() if timing else None
+    try:
+        response = await call_next(request)
+    finally:
+        trace = metrics.end_trace(token) if token is not None else None
     duration = time.perf_counter() - start
     response.headers["X-Process-Time"] = f"{duration:.4f}s"
+    if trace is not None:
+        # streamed bodies only report the stages run before the headers went out
+        parts = [metrics.server_timing(trace), f"total;dur={duration * 1000:.1f}"]
+        response.headers["Server-Timing"] = ", ".join(p for p in parts if p)
+    stats = getattr(request.state, "inference", None)
+    if stats:
+        response.headers["X-Queue-Depth"] = str(stats["queue_depth"])
+        response.headers["X-Queue-Wait"] = f"{stats['queue_wait']:.4f}s"
+        response.headers["X-Service-Time"] = f"{stats['service_time']:.4f}s"
     return response
 
 # ──────────────────────────
@@ -125,14 +180,185 @@ def clamp_num(n: int) -> int:
         raise HTTPException(400, detail="num_questions must be ≥ 1")
     return min(n, config.max_questions)
 
+
+ENTRYPOINTS = {"model": "app.model_quiz.entrypoint", "retrieval": "app.retrieval_quiz.entrypoint"}
+
+# process workers warm themselves; loading the models here as well would only
+# cost the API process memory it never uses
+executor = InferenceExecutor(
+    config.inference.workers, config.inference.max_queue, config.inference.executor,
+    warmup_module=ENTRYPOINTS[config.generator_mode] if config.warmup_on_start else None,
+)
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    executor.shutdown()
+
+
+def _executor_metrics():
+    yield "quiz_inference_inflight", "gauge", "Jobs running or queued on the inference executor.", {}, executor.inflight
+    yield "quiz_inference_queued", "gauge", "Jobs waiting for an inference worker.", {}, executor.queued
+
+metrics.register_collector(_executor_metrics)
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    if not config.metrics.enabled:
+        raise HTTPException(404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+async def run_inference(http_request: Request, fn, *args):
+    try:
+        result, stats = await executor.run(fn, *args)
+    except QueueFullError:
+        logger.warning("Inference queue full (%d in flight); rejecting request", executor.inflight)
+        raise HTTPException(503, detail="Server busy, retry later", headers={"Retry-After": str(config.inference.retry_after)})
+    http_request.state.inference = stats
+    return result
+
+response_cache = ResponseCache(config.response_cache.max_size) if config.response_cache.enabled else None
+
+
+def _response_cache_metrics():
+    yield "quiz_response_cache_hits_total", "counter", "Seeded responses served from cache.", {}, response_cache.hits
+    yield "quiz_response_cache_misses_total", "counter", "Seeded responses computed.", {}, response_cache.misses
+    yield "quiz_response_cache_entries", "gauge", "Cached seeded responses.", {}, len(response_cache)
+
+if response_cache is not None:
+    metrics.register_collector(_response_cache_metrics)
+
+
+def etag_response(http_request: Request, etag: str, body: bytes) -> Response:
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+async def generate_quiz(http_request: Request, request: MCQRequest, n: int, run_fn, version_fn, to_response):
+    """Run one quiz on the executor.
+
+    A seeded request without a session_id is a pure function of its
+    parameters and the bank version, so its body is cached under
+    (mode, goal, difficulty, n, seed, version) and revalidated by ETag.
+    """
+    args = (request.goal, request.difficulty, n, request.session_id, request.seed)
+    if response_cache is None or request.seed is None or request.session_id:
+        return to_response(await run_inference(http_request, run_fn, *args))
+
+    key = (config.generator_mode, request.goal, request.difficulty, n, request.seed)
+    version = version_fn(request.goal)
+    if version is None:
+        return to_response(await run_inference(http_request, run_fn, *args))
+    hit = response_cache.get(key + (version,))
+    if hit is not None:
+        return etag_response(http_request, *hit)
+
+    response = to_response(await run_inference(http_request, run_fn, *args))
+    body = json.dumps(response.model_dump(exclude_none=True), ensure_ascii=False).encode("utf-8")
+    etag = response_cache.put(key + (version,), body)
+    return etag_response(http_request, etag, body)
+
+
+def validate_batch(batch: BatchRequest, supported_goals: List[str]):
+    if len(batch.quizzes) > config.max_batch_quizzes:
+        raise HTTPException(400, detail=f"At most {config.max_batch_quizzes} quizzes per batch")
+    for i, q in enumerate(batch.quizzes):
+        if q.goal not in supported_goals:
+            raise HTTPException(400, detail=f"quizzes[{i}]: Unsupported goal: {q.goal}")
+        if q.difficulty not in config.supported_difficulties:
+            raise HTTPException(400, detail=f"quizzes[{i}]: Unsupported difficulty: {q.difficulty}")
+    return [(q.goal, q.difficulty, clamp_num(q.num_questions), q.session_id, q.seed) for q in batch.quizzes]
+
+
+async def open_stream(gen_fn, *args):
+    """Start a generator on the executor and wait for its first item.
+
+    Failing before any byte is sent lets callers still answer 503/500;
+    returns (first_item, rest) with first_item None for an empty stream.
+    """
+    stream = executor.stream(gen_fn, *args)
+    try:
+        return await stream.__anext__(), stream
+    except QueueFullError:
+        raise HTTPException(503, detail="Server busy, retry later", headers={"Retry-After": str(config.inference.retry_after)})
+    except StopAsyncIteration:
+        return None, stream
+    except (ValueError, RuntimeError) as e:
+        logger.error("Streaming generation failed: %s", e)
+        raise HTTPException(500, detail=str(e))
+
+
+async def stream_batch(gen_fn, specs, to_response):
+    """NDJSON response with one line per quiz, written as each one completes."""
+    first, stream = await open_stream(gen_fn, specs)
+
+    def line(idx, result):
+        if isinstance(result, Exception):
+            logger.error("Batch quiz %d failed: %s", idx, result)
+            body = {"index": idx, "error": str(result)}
+        else:
+            body = {"index": idx, **to_response(specs[idx], result).model_dump(exclude_none=True)}
+        return json.dumps(body, ensure_ascii=False) + "\n"
+
+    async def body():
+        if first is None:
+            return
+        try:
+            yield line(*first)
+            async for item in stream:
+                yield line(*item)
+        except Exception as e:
+            logger.exception("Batch generation failed")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+async def stream_questions(http_request: Request, request: MCQRequest, supported_goals: List[str], gen_fn):
+    """Stream QuestionItems as NDJSON, or as SSE when the client accepts text/event-stream."""
+    if request.goal not in supported_goals:
+        raise HTTPException(400, detail=f"Unsupported goal: {request.goal}")
+    if request.difficulty not in config.supported_difficulties:
+        raise HTTPException(400, detail=f"Unsupported difficulty: {request.difficulty}")
+    n = clamp_num(request.num_questions)
+
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+    first, stream = await open_stream(gen_fn, request.goal, request.difficulty, n, request.session_id, request.seed)
+
+    def frame(payload, event="question"):
+        data = json.dumps(payload, ensure_ascii=False)
+        return f"event: {event}\ndata: {data}\n\n" if sse else data + "\n"
+
+    async def body():
+        try:
+            if first is not None:
+                yield frame(QuestionItem(**first).model_dump(exclude_none=True))
+            async for q in stream:
+                yield frame(QuestionItem(**q).model_dump(exclude_none=True))
+        except (ValueError, RuntimeError, ValidationError) as e:
+            logger.error("Streaming generation failed: %s", e)
+            yield frame({"error": str(e)}, "error")
+            return
+        if sse:
+            yield frame({"goal": request.goal, "difficulty": request.difficulty}, "done")
+
+    return StreamingResponse(body(), media_type="text/event-stream" if sse else "application/x-ndjson")
+
 # ──────────────────────────
 # Quiz Generation Endpoint
 # ──────────────────────────
 if config.generator_mode == "model":
-    from app.model_quiz.entrypoint import run_quiz as run_model_quiz
+    from app.model_quiz.entrypoint import run_quiz as run_model_quiz, run_quiz_batch as run_model_quiz_batch, stream_quiz as stream_model_quiz, cache_stats, warmup as warmup_generator, reload as reload_bank, version as bank_version
+
+    @app.get("/generate/cache", tags=["Quiz"])
+    def generation_cache_stats():
+        return cache_stats()
 
     @app.post("/generate", response_model=QuizResponse, response_model_exclude_none=True, tags=["Quiz"])
-    def generate_model(request: MCQRequest):
+    async def generate_model(request: MCQRequest, http_request: Request):
         if request.goal not in config.model_supported_goals:
             raise HTTPException(400, detail=f"Unsupported goal: {request.goal}")
         if request.difficulty not in config.supported_difficulties:
@@ -142,17 +368,32 @@ if config.generator_mode == "model":
         logger.info("[Model] Generating %d questions for %s/%s", n, request.goal, request.difficulty)
 
         try:
-            result = run_model_quiz(request.goal, request.difficulty, n)
-            items = [QuestionItem(**q) for q in result.get("questions", [])]
-            return QuizResponse(goal=result.get("goal"), difficulty=result.get("difficulty"), questions=items)
+            return await generate_quiz(
+                http_request, request, n, run_model_quiz, bank_version,
+                lambda r: QuizResponse(goal=r.get("goal"), difficulty=r.get("difficulty"), questions=[QuestionItem(**q) for q in r.get("questions", [])]),
+            )
         except (ValueError, RuntimeError, ValidationError) as e:
             logger.error("Model generation failed: %s", e)
             raise HTTPException(500, detail=str(e))
+
+    @app.post("/generate/stream", tags=["Quiz"])
+    async def generate_model_stream(request: MCQRequest, http_request: Request):
+        logger.info("[Model] Streaming %d questions for %s/%s", request.num_questions, request.goal, request.difficulty)
+        return await stream_questions(http_request, request, config.model_supported_goals, stream_model_quiz)
+
+    @app.post("/generate/batch", tags=["Quiz"])
+    async def generate_model_batch(batch: BatchRequest):
+        specs = validate_batch(batch, config.model_supported_goals)
+        logger.info("[Model] Generating batch of %d quizzes", len(specs))
+        return await stream_batch(
+            run_model_quiz_batch, specs,
+            lambda spec, r: QuizResponse(goal=r["goal"], difficulty=r["difficulty"], questions=[QuestionItem(**q) for q in r["questions"]]),
+        )
 else:
-    from app.retrieval_quiz.entrypoint import retrieve_quiz as run_retrieval_quiz
+    from app.retrieval_quiz.entrypoint import retrieve_quiz as run_retrieval_quiz, retrieve_quiz_batch as run_retrieval_quiz_batch, stream_quiz as stream_retrieval_quiz, warmup as warmup_generator, reload as reload_bank, version as bank_version
 
     @app.post("/generate", response_model=QuizResponse, response_model_exclude_none=True, tags=["Quiz"])
-    def generate_retrieval(request: MCQRequest):
+    async def generate_retrieval(request: MCQRequest, http_request: Request):
         if request.goal not in config.retrieval_supported_goals:
             raise HTTPException(400, detail=f"Unsupported goal: {request.goal}")
         if request.difficulty not in config.supported_difficulties:
@@ -162,13 +403,87 @@ else:
         logger.info("[Retrieval] Generating %d questions for %s/%s", n, request.goal, request.difficulty)
 
         try:
-            result = run_retrieval_quiz(request.goal, request.difficulty, n)
-            items = [QuestionItem(**q) for q in result]
-            return QuizResponse(goal=request.goal, difficulty=request.difficulty, questions=items)
+            return await generate_quiz(
+                http_request, request, n, run_retrieval_quiz, bank_version,
+                lambda r: QuizResponse(goal=request.goal, difficulty=request.difficulty, questions=[QuestionItem(**q) for q in r]),
+            )
         except (ValueError, RuntimeError, ValidationError) as e:
             logger.error("Retrieval generation failed: %s", e)
             raise HTTPException(500, detail=str(e))
 
+    @app.post("/generate/stream", tags=["Quiz"])
+    async def generate_retrieval_stream(request: MCQRequest, http_request: Request):
+        logger.info("[Retrieval] Streaming %d questions for %s/%s", request.num_questions, request.goal, request.difficulty)
+        return await stream_questions(http_request, request, config.retrieval_supported_goals, stream_retrieval_quiz)
+
+    @app.post("/generate/batch", tags=["Quiz"])
+    async def generate_retrieval_batch(batch: BatchRequest):
+        specs = validate_batch(batch, config.retrieval_supported_goals)
+        logger.info("[Retrieval] Generating batch of %d quizzes", len(specs))
+        return await stream_batch(
+            run_retrieval_quiz_batch, specs,
+            lambda spec, r: QuizResponse(goal=spec[0], difficulty=spec[1], questions=[QuestionItem(**q) for q in r]),
+        )
+
+# ──────────────────────────
+# Warm-up / Readiness
+# ──────────────────────────
+# "/" is liveness and answers as soon as the process is up; "/ready" only
+# turns 200 once the active mode's models and indexes are loaded.
+readiness = {"state": "ready" if not config.warmup_on_start else "pending", "error": None}
+
+
+def run_warmup():
+    readiness["state"] = "warming"
+    start = time.perf_counter()
+    try:
+        if executor.kind == "process":
+            executor.warm()
+        else:
+            warmup_generator()
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        readiness.update(state="failed", error=str(e))
+        return
+    readiness["state"] = "ready"
+    logger.info("Warm-up finished in %.2fs (%s mode)", time.perf_counter() - start, config.generator_mode)
+
+
+@app.on_event("startup")
+def start_warmup():
+    if config.warmup_on_start:
+        threading.Thread(target=run_warmup, name="warmup", daemon=True).start()
+
+
+@app.post("/admin/reload", tags=["Admin"])
+async def admin_reload(http_request: Request, goal: Optional[str] = None, refit: bool = False):
+    """Ingest edited question banks without a restart.
+
+    Only the worker that receives the request reloads. Under
+    `--workers N` the others pick up edits on their own (model mode on the
+    next request's mtime check, retrieval mode via retrieval_reload.watch).
+    """
+    # disabled outright unless an admin token is configured
+    if not config.admin_token:
+        raise HTTPException(404, detail="Not Found")
+    if not secrets.compare_digest(http_request.headers.get("x-admin-token", ""), config.admin_token):
+        raise HTTPException(403, detail="Invalid admin token")
+    args = () if config.generator_mode == "model" else (goal, refit)
+    try:
+        return await run_inference(http_request, reload_bank, *args)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    except OSError as e:
+        # a configured bank file that is missing or unreadable
+        raise HTTPException(404, detail=f"Question bank unavailable: {e}")
+
+
+@app.get("/ready", tags=["Health"])
+def readiness_check():
+    if readiness["state"] != "ready":
+        return JSONResponse(status_code=503, content=readiness, headers={"Retry-After": str(config.inference.retry_after)})
+    return readiness
+
 # ──────────────────────────
 # Entry Point
 # ──────────────────────────
@@ -0,0 +1,204 @@
+import time
+import bisect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Stage histograms, batch sizes and collector-backed gauges, rendered in the
+# Prometheus text format by /metrics. When disabled every hook is a single
+# flag check.
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZES = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+RATIOS = (0.25, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0)
+
+_enabled = True
+_lock = threading.Lock()
+_histograms: Dict[str, "Histogram"] = {}
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+# (stage, seconds) pairs for the current request when Server-Timing is on
+_trace: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("trace", default=None)
+# set in process-pool workers: every observation is also queued here and
+# shipped back to the API process with the job's result (see `drain`/`merge`)
+_outbox: Optional[List[Tuple[str, float, Dict[str, str]]]] = None
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+
+    def observe(self, value: float, labels: Dict[str, str]) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            s = self.series.get(key)
+            if s is None:
+                # one count per bucket, then +Inf, sum
+                s = self.series[key] = [0.0] * (len(self.buckets) + 2)
+            s[bisect.bisect_left(self.buckets, value)] += 1
+            s[-1] += value
+            if _outbox is not None:
+                _outbox.append((self.name, value, labels))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for key, counts in series.items():
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ["+Inf"], counts[:-1]):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(dict(key, le=str(bound)))} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(dict(key))} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(dict(key))} {int(cumulative)}")
+        return lines
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def configure(enabled: bool) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = SECONDS) -> Histogram:
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram(name, help, buckets)
+    return h
+
+
+STAGE_SECONDS = histogram("quiz_stage_seconds", "Time spent per pipeline stage.")
+BATCH_SIZE = histogram("quiz_batch_size", "Items per model call.", SIZES)
+PADDING_EFFICIENCY = histogram("quiz_padding_efficiency", "Real over padded input tokens per bucketed generate() call.", RATIOS)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, {"stage": stage})
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def stage(name: str):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def traced(name: str):
+    """Decorator form of `stage`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe_stage(name, time.perf_counter() - start)
+        return inner
+    return wrap
+
+
+def observe_batch(model: str, size: int) -> None:
+    if _enabled:
+        BATCH_SIZE.observe(size, {"model": model})
+
+
+def observe_padding(model: str, real: int, padded: int) -> None:
+    if _enabled and padded:
+        PADDING_EFFICIENCY.observe(real / padded, {"model": model})
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """`fn()` yields (name, type, help, labels, value) samples at scrape time."""
+    _collectors.append(fn)
+
+
+def start_trace() -> contextvars.Token:
+    return _trace.set([])
+
+
+def end_trace(token: contextvars.Token) -> List[Tuple[str, float]]:
+    trace = _trace.get() or []
+    _trace.reset(token)
+    return trace
+
+
+def tracing() -> bool:
+    return _trace.get() is not None
+
+
+def ship() -> None:
+    """Queue this process's observations for `drain` (process-pool workers)."""
+    global _outbox
+    if _outbox is None:
+        _outbox = []
+
+
+def drain() -> Tuple[list, Dict[str, Tuple[str, Tuple[float, ...]]]]:
+    """Observations queued since the last drain, plus their histograms' specs."""
+    global _outbox
+    with _lock:
+        observed, _outbox = _outbox or [], []
+        specs = {name: (_histograms[name].help, _histograms[name].buckets) for name in {o[0] for o in observed}}
+    return observed, specs
+
+
+def merge(observed: list, specs: Dict[str, Tuple[str, Tuple[float, ...]]], trace: List[Tuple[str, float]]) -> None:
+    """Apply a worker's drained observations and stage trace in this process."""
+    if not _enabled:
+        return
+    for name, value, labels in observed:
+        histogram(name, *specs[name]).observe(value, labels)
+    current = _trace.get()
+    if current is not None:
+        current.extend(trace)
+
+
+def server_timing(trace: List[Tuple[str, float]]) -> str:
+    # repeated stages (one per chunk or batch) are summed
+    total: Dict[str, float] = {}
+    for name, seconds in trace:
+        total[name] = total.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in total.items())
+
+
+def render() -> str:
+    lines: List[str] = []
+    with _lock:
+        histograms = list(_histograms.values())
+    for h in histograms:
+        lines.extend(h.render())
+
+    # samples of one metric must be contiguous
+    grouped: Dict[str, list] = {}
+    for collect in _collectors:
+        for name, kind, help, labels, value in collect():
+            grouped.setdefault(name, [kind, help, []])[2].append((labels, value))
+    for name, (kind, help, samples) in grouped.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_labels(labels)} {value}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
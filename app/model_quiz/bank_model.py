@@ -0,0 +1,51 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Tuple, List
+
+logger = logging.getLogger("model.bank")
+
+# (question, answer, distractors)
+Generated = Tuple[str, str, List[str]]
+
+
+def item_key(item: Dict[str, Any]) -> str:
+    raw = json.dumps(
+        [item.get("goal", ""), item.get("difficulty", ""), item.get("context", "").strip(), item.get("correct_answer", "").strip()],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def save_bank(path: str, namespace: str, entries: Dict[str, Dict[str, Generated]]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump({"namespace": namespace, "entries": entries}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+class QuestionBank:
+    """Read-only view of the artifact written by `app.model_quiz.precompute`.
+
+    Entries are keyed by `item_key(item)` then question type, so items added
+    to the dataset after the build simply miss and go through the live path.
+    """
+
+    def __init__(self, path: str, namespace: Optional[str] = None):
+        self.path = path
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        self.entries: Dict[str, Dict[str, list]] = data.get("entries", {})
+        if namespace is not None and data.get("namespace") != namespace:
+            logger.warning("Precomputed bank %s was built with different model settings", path)
+        logger.info("Loaded %d precomputed items from %s", len(self.entries), path)
+
+    def get(self, item: Dict[str, Any], qtype: str) -> Optional[Generated]:
+        hit = self.entries.get(item_key(item), {}).get(qtype)
+        if hit is None:
+            return None
+        q, a, d = hit
+        return q, a, d
@@ -0,0 +1,90 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Any
+
+from app import metrics
+
+logger = logging.getLogger("model.batching")
+
+
+class _Pending:
+    __slots__ = ("items", "future")
+
+    def __init__(self, items: List[Any]):
+        self.items = items
+        self.future: Future = Future()
+
+
+class MicroBatcher:
+    """Merges calls from concurrent requests into one model call.
+
+    The worker thread takes the first waiting call, keeps collecting for up
+    to `window_ms` or until `max_batch_size` items are queued, runs `fn` once
+    on the concatenated items and hands each caller back its own slice.
+    `fn` must map a list of inputs to a list of outputs of the same length.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], window_ms: float = 10, max_batch_size: int = 32, name: str = "batcher"):
+        self.fn = fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, items: List[Any]) -> Future:
+        pending = _Pending(list(items))
+        if not pending.items:
+            pending.future.set_result([])
+            return pending.future
+        self._ensure_worker()
+        self._queue.put(pending)
+        return pending.future
+
+    def __call__(self, items: List[Any]) -> List[Any]:
+        return self.submit(items).result()
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        size = len(batch[0].items)
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                nxt = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(nxt)
+            size += len(nxt.items)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            flat = [x for p in batch for x in p.items]
+            metrics.observe_batch(self.name, len(flat))
+            try:
+                out = self.fn(flat)
+            except Exception as e:
+                for p in batch:
+                    p.future.set_exception(e)
+                continue
+
+            logger.debug("[%s] ran %d items from %d requests", self.name, len(flat), len(batch))
+            start = 0
+            for p in batch:
+                p.future.set_result(out[start:start + len(p.items)])
+                start += len(p.items)
@@ -0,0 +1,92 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+Entry = Tuple[str, str]  # (question, answer)
+
+
+class GenerationCache:
+    """Bounded LRU of generated (question, answer) pairs per dataset item.
+
+    Keys hash (namespace, goal, context, answer, type); the namespace should
+    change whenever the models or generation settings do. With `path` set,
+    entries are also written to SQLite and survive restarts; the table keeps
+    the `max_rows` most recently written entries, so rows orphaned by an old
+    namespace age out instead of accumulating.
+    """
+
+    def __init__(self, namespace: str, max_size: int = 4096, path: Optional[str] = None, max_rows: int = 100_000):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS generations (key TEXT PRIMARY KEY, question TEXT, answer TEXT)")
+
+    def key(self, goal: str, context: str, answer: str, qtype: str) -> str:
+        raw = json.dumps([self.namespace, goal, context, answer, qtype], ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, entry: Entry):
+        self._mem[key] = entry
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+
+    def get_many(self, keys: List[str]) -> List[Optional[Entry]]:
+        with self._lock:
+            found = [self._mem.get(k) for k in keys]
+            for k, v in zip(keys, found):
+                if v is not None:
+                    self._mem.move_to_end(k)
+
+            missing = [k for k, v in zip(keys, found) if v is None]
+            if missing and self._db is not None:
+                marks = ",".join("?" * len(missing))
+                rows = self._db.execute(f"SELECT key, question, answer FROM generations WHERE key IN ({marks})", missing)
+                stored = {k: (q, a) for k, q, a in rows}
+                for i, k in enumerate(keys):
+                    if found[i] is None and k in stored:
+                        found[i] = stored[k]
+                        self._remember(k, stored[k])
+
+            n_hit = sum(v is not None for v in found)
+            self.hits += n_hit
+            self.misses += len(keys) - n_hit
+            return found
+
+    def put_many(self, entries: Dict[str, Entry]):
+        with self._lock:
+            for k, v in entries.items():
+                self._remember(k, v)
+            if self._db is not None and entries:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO generations (key, question, answer) VALUES (?, ?, ?)",
+                    [(k, q, a) for k, (q, a) in entries.items()],
+                )
+                # REPLACE re-inserts, so rowid order is write order
+                self._db.execute(
+                    "DELETE FROM generations WHERE rowid <= (SELECT MAX(rowid) FROM generations) - ?",
+                    (self.max_rows,),
+                )
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._mem),
+            "max_size": self.max_size,
+        }
@@ -23,7 +23,41 @@ T5_MODEL_PATH = cfg["t5-model_path"]
 GRAMMAR_MODEL_PATH = cfg["grammar_model_path"]
 QA_MODEL_PATHS = cfg["qa_model_paths"]
 SBERT_PATH = cfg["sentence_transformer_path"]
+EMBEDDING_CACHE_DIR = cfg.get("embedding_cache_dir", "./cache")
 USE_QA = True
+QA_THRESHOLD = 0.3
+QA_STRATEGY = cfg.get("qa_strategy", "concurrent")  # "concurrent" or "first_wins"
+# QA windows per forward pass; bounds activation memory on long batches
+QA_WINDOW_BATCH = cfg.get("qa_window_batch", 32)
+BATCHING = cfg.get("batching", {})
+USE_BATCHING = BATCHING.get("enabled", True)
+BATCH_WINDOW_MS = BATCHING.get("window_ms", 10)
+MAX_BATCH_SIZE = BATCHING.get("max_batch_size", 32)
+# generate() batches are split into buckets of similar token length
+BUCKET_MAX_SIZE = BATCHING.get("bucket_max_size", MAX_BATCH_SIZE)
+BUCKET_LENGTH_RATIO = BATCHING.get("bucket_length_ratio", 1.5)
+GRAMMAR_PRECHECK = cfg.get("grammar_precheck", False)
+GENERATION_CACHE = cfg.get("generation_cache", {})
+GENERATION_CACHE_SIZE = GENERATION_CACHE.get("max_size", 4096)
+GENERATION_CACHE_PATH = GENERATION_CACHE.get("path")
+GENERATION_CACHE_MAX_ROWS = GENERATION_CACHE.get("max_rows", 100_000)
+# served-row tracking for requests carrying a session_id
+SESSIONS = cfg.get("sessions", {})
+INFERENCE_EXECUTOR = cfg.get("inference", {}).get("executor", "thread")
+STREAM_CHUNK_SIZE = cfg.get("stream_chunk_size", 2)
+SERVING_MODE = cfg.get("serving_mode", "live")  # "live" or "precomputed"
+PRECOMPUTED_PATH = cfg.get("precomputed_path", "./cache/question_bank.json.gz")
+# per model: "fp32", "int8" (dynamic quantization of Linear layers) or "onnx"
+PRECISION = {name: cfg.get("precision", {}).get(name, "fp32") for name in ("t5", "grammar", "qa", "sbert")}
+# ONNX exports are written here once and loaded from here afterwards
+ONNX_CACHE_DIR = cfg.get("onnx_cache_dir", "./cache/onnx")
+TORCH_THREADS = cfg.get("torch_threads", {})  # {"intra": int|null, "interop": int|null}
+MODEL_SERVER = cfg.get("model_server", {})
+MODEL_SERVER_ENABLED = MODEL_SERVER.get("enabled", False)
+MODEL_SERVER_SOCKET = MODEL_SERVER.get("socket", "./cache/model_server.sock")
+# random per server start, written 0600; clients must run as the same user
+MODEL_SERVER_KEY_FILE = MODEL_SERVER.get("key_file", "./cache/model_server.key")
+MODEL_SERVER_TIMEOUT = MODEL_SERVER.get("timeout", 600)
 QG_TEMPLATE = "generate question: domain: {goal} context: {context} answer: {answer}"
 T5_GEN_CONFIG = {
     "max_length": 32,
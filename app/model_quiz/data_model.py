@@ -1,11 +1,64 @@
-import json
-from typing import List, Dict, Any
+import os
+import threading
+from typing import List, Dict, Any, Tuple
+
+from app import metrics
+from app.normalize import normalize_goal, normalize_difficulty
+from app.records import MODEL_SCHEMA, load_records
 
 def load_dataset(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data if isinstance(data, list) else data.get("data", [])
+    return load_records(path, MODEL_SCHEMA)[0]
 
 def filter_dataset(dataset: List[Dict[str, Any]], goal: str, diff: str) -> List[Dict[str, Any]]:
-    g = goal.lower().strip()
-    return [item for item in dataset if item.get("goal", "").lower() == g and item.get("difficulty", "").lower() == diff]
+    key = _key(goal, diff)
+    return [item for item in dataset if _key(item.get("goal", ""), item.get("difficulty", "")) == key]
+
+def _key(goal: str, diff: str) -> Tuple[str, str]:
+    return normalize_goal(goal), normalize_difficulty(diff)
+
+class DatasetStore:
+    """Resident copy of the model dataset, indexed by (goal, difficulty).
+
+    The file is parsed once and re-parsed only when its mtime changes, so
+    `pool()` is a dict lookup on the request path.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.load_stats = None
+        self._items: List[Dict[str, Any]] = []
+        self._index: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            with metrics.stage("load_dataset"):
+                items, stats = load_records(self.path, MODEL_SCHEMA)
+            index: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+            for item in items:
+                index.setdefault(_key(item.get("goal", ""), item.get("difficulty", "")), []).append(item)
+            # swap both views together so readers never mix generations
+            self._items, self._index, self._mtime = items, index, mtime
+            self.load_stats = stats
+        return True
+
+    @property
+    def version(self):
+        self.refresh()
+        return self._mtime
+
+    @property
+    def items(self) -> List[Dict[str, Any]]:
+        self.refresh()
+        return self._items
+
+    def pool(self, goal: str, diff: str) -> List[Dict[str, Any]]:
+        self.refresh()
+        return self._index.get(_key(goal, diff), [])
@@ -0,0 +1,152 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+
+logger = logging.getLogger("model.embeddings")
+
+_CACHE_FILE = re.compile(r"sbert-[0-9a-f]{16}\.npy")
+
+
+def dataset_strings(items: Iterable[Dict[str, Any]]) -> List[str]:
+    seen = dict()
+    for item in items:
+        ans = item.get("correct_answer", "").strip()
+        if ans:
+            seen.setdefault(ans, None)
+        for d in item.get("distractors", []):
+            seen.setdefault(d, None)
+    return list(seen)
+
+
+class EmbeddingStore:
+    """SBERT embeddings for every answer/distractor string in the dataset.
+
+    Rows are L2-normalised float32, so cosine similarity is a dot product.
+    The matrix is cached as `<cache_dir>/sbert-<fingerprint>.npy` and opened
+    memory-mapped; the fingerprint covers the encoder path and the strings,
+    so editing the dataset invalidates the cache. On a dataset reload only
+    strings not already embedded are sent to the encoder, and once the new
+    snapshot is published older `sbert-*.npy` files are deleted.
+    """
+
+    def __init__(self, encoder, encoder_path: str, cache_dir: str, max_extra: int = 4096):
+        self.encoder = encoder
+        self.encoder_path = encoder_path
+        self.cache_dir = cache_dir
+        self.max_extra = max_extra
+        # (matrix, index) published together in one assignment; readers take
+        # the tuple once so a concurrent sync() never pairs mismatched halves
+        self._snapshot: Tuple[np.ndarray, Dict[str, int]] = (np.zeros((0, 0), dtype=np.float32), {})
+        self.version = None
+        self._extra: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snapshot[0]
+
+    @property
+    def index(self) -> Dict[str, int]:
+        return self._snapshot[1]
+
+    def _fingerprint(self, strings: List[str]) -> str:
+        h = hashlib.sha1(self.encoder_path.encode("utf-8"))
+        for s in strings:
+            h.update(b"\0" + s.encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        metrics.observe_batch("sbert", len(texts))
+        emb = self.encoder.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(emb, dtype=np.float32)
+
+    def sync(self, items: Iterable[Dict[str, Any]], version=None) -> None:
+        if version is not None and version == self.version:
+            return
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            old_matrix, old_index = self._snapshot
+            strings = dataset_strings(items)
+            fp = self._fingerprint(strings)
+            path = os.path.join(self.cache_dir, f"sbert-{fp}.npy")
+            if os.path.isfile(path):
+                matrix = np.load(path, mmap_mode="r")
+                logger.info("Loaded %d cached embeddings from %s", len(strings), path)
+            else:
+                new = [s for s in strings if s not in old_index]
+                fresh = self._encode(new) if new else np.zeros((0, old_matrix.shape[1]), dtype=np.float32)
+                if old_index and strings:
+                    # reuse rows of the previous generation; only `new` was encoded
+                    added = {s: len(old_matrix) + j for j, s in enumerate(new)}
+                    rows = np.fromiter((old_index.get(s, added.get(s)) for s in strings), dtype=np.int64, count=len(strings))
+                    matrix = np.vstack([old_matrix, fresh])[rows]
+                else:
+                    matrix = fresh if strings else np.zeros((0, 0), dtype=np.float32)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = path + ".tmp.npy"
+                np.save(tmp, matrix)
+                os.replace(tmp, path)
+                logger.info("Encoded %d new of %d dataset strings into %s", len(new), len(strings), path)
+            self._snapshot = (matrix, {s: i for i, s in enumerate(strings)})
+            self._extra.clear()
+            self.version = version
+            self._prune(path)
+
+    def _prune(self, keep: str) -> None:
+        # a reader may still hold the old snapshot; on POSIX its mapping
+        # outlives the unlink, elsewhere the remove fails and is retried next sync
+        for name in os.listdir(self.cache_dir):
+            stale = os.path.join(self.cache_dir, name)
+            if _CACHE_FILE.fullmatch(name) and stale != keep:
+                try:
+                    os.remove(stale)
+                except OSError as e:
+                    logger.debug("Could not remove stale embeddings %s: %s", stale, e)
+
+    def encode(self, texts: List[str], snapshot: Optional[Tuple[np.ndarray, Dict[str, int]]] = None) -> np.ndarray:
+        matrix, index = snapshot or self._snapshot
+        known: Dict[str, np.ndarray] = {}
+        missing = []
+        for t in dict.fromkeys(texts):
+            if t in index:
+                continue
+            v = self._extra.get(t)
+            if v is None:
+                missing.append(t)
+            else:
+                known[t] = v
+        if missing:
+            fresh = dict(zip(missing, self._encode(missing)))
+            known.update(fresh)
+            with self._lock:
+                self._extra.update(fresh)
+                while len(self._extra) > self.max_extra:
+                    self._extra.popitem(last=False)
+
+        rows = [matrix[index[t]] if t in index else known[t] for t in texts]
+        return np.stack(rows) if rows else np.zeros((0, matrix.shape[1]), dtype=np.float32)
+
+    def rank(self, answers: List[str], pools: List[List[str]], top_k: int = 3) -> List[List[str]]:
+        # one gather + one row-wise dot over every candidate of every pool
+        flat = [d for pool in pools for d in pool]
+        if not flat:
+            return [[] for _ in pools]
+        owner = np.repeat(np.arange(len(pools)), [len(p) for p in pools])
+        snapshot = self._snapshot
+        sims = np.einsum("ij,ij->i", self.encode(flat, snapshot), self.encode(answers, snapshot)[owner])
+
+        result, start = [], 0
+        for pool in pools:
+            seg = sims[start:start + len(pool)]
+            result.append([pool[j] for j in np.argsort(-seg, kind="stable")[:top_k]])
+            start += len(pool)
+        return result
@@ -1,10 +1,20 @@
 # app/model_quiz/entrypoint.py
 
-from app.model_quiz.quiz_model import run_model_quiz
+from app.model_quiz.quiz_model import run_model_quiz, iter_model_quiz, iter_model_quiz_batch, cache_stats, warmup, dataset_version, reload_dataset as reload
 
 # Public interface for FastAPI
-def run_quiz(goal: str, difficulty: str, num_questions: int):
-    return run_model_quiz(goal, difficulty, num_questions)
+def run_quiz(goal: str, difficulty: str, num_questions: int, session_id: str = None, seed: int = None):
+    return run_model_quiz(goal, difficulty, num_questions, session_id, seed)
+
+def stream_quiz(goal: str, difficulty: str, num_questions: int, session_id: str = None, seed: int = None):
+    return iter_model_quiz(goal, difficulty, num_questions, session_id, seed)
+
+def run_quiz_batch(specs):
+    return iter_model_quiz_batch(specs)
+
+def version(goal: str):
+    """Identifies the data a quiz for `goal` is drawn from (keys the response cache)."""
+    return dataset_version()
 
 # Optional CLI test
 if __name__ == "__main__":
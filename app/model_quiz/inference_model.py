@@ -0,0 +1,128 @@
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from app import metrics
+from .loaders_model import load_t5, load_grammar, load_qa, load_sbert
+from .qa_model import BatchedQA
+from .config_model import T5_GEN_CONFIG, BUCKET_MAX_SIZE, BUCKET_LENGTH_RATIO, QA_WINDOW_BATCH
+
+# In-process model calls. quiz_model uses these directly, or model_server
+# exposes the same functions to thin API workers over a Unix socket.
+
+logger = logging.getLogger("model.inference")
+
+_stats_lock = threading.Lock()
+_token_stats: Dict[str, Dict[str, int]] = {}
+
+
+def buckets(lengths: List[int], max_size: int = BUCKET_MAX_SIZE, ratio: float = BUCKET_LENGTH_RATIO) -> List[List[int]]:
+    """Group row indices by length so each group pads to a similar size.
+
+    Rows are taken shortest first; a bucket is closed when it holds
+    `max_size` rows or the next row is more than `ratio` times longer than
+    the bucket's shortest.
+    """
+    out: List[List[int]] = []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        if out and len(out[-1]) < max_size and lengths[i] <= lengths[out[-1][0]] * ratio:
+            out[-1].append(i)
+        else:
+            out.append([i])
+    return out
+
+
+def _record(name: str, real: int, padded: int, unbucketed: int) -> None:
+    with _stats_lock:
+        s = _token_stats.setdefault(name, {"calls": 0, "real": 0, "padded": 0, "unbucketed": 0})
+        s["calls"] += 1
+        s["real"] += real
+        s["padded"] += padded
+        s["unbucketed"] += unbucketed
+    metrics.observe_padding(name, real, padded)
+    logger.debug(
+        "%s: %d real / %d padded tokens (%.0f%% efficient, %.0f%% without bucketing)",
+        name, real, padded, 100.0 * real / max(1, padded), 100.0 * real / max(1, unbucketed),
+    )
+
+
+def token_stats() -> Dict[str, Dict[str, Any]]:
+    """Cumulative real vs padded input tokens per generator."""
+    with _stats_lock:
+        return {
+            name: dict(s, efficiency=round(s["real"] / max(1, s["padded"]), 4))
+            for name, s in _token_stats.items()
+        }
+
+
+def run_bucketed(name: str, lengths: List[int], run: Callable[[List[int]], Tuple[List[Any], int]]) -> List[Any]:
+    """Call `run(rows)` once per length bucket and return results in input order.
+
+    `run` returns the outputs for `rows` and the padded token count of its
+    batch; padding efficiency is recorded under `name`.
+    """
+    if not lengths:
+        return []
+    out: List[Any] = [None] * len(lengths)
+    padded = 0
+    for rows in buckets(lengths):
+        results, n_padded = run(rows)
+        padded += n_padded
+        metrics.observe_batch(name, len(rows))
+        for i, r in zip(rows, results):
+            out[i] = r
+    _record(name, sum(lengths), padded, max(lengths) * len(lengths))
+    return out
+
+
+def _generate(name: str, tok, mdl, dev, inputs: List[str], max_length: int, **gen) -> List[str]:
+    """generate() per length bucket with dynamic padding, in input order."""
+    import torch
+    if not inputs:
+        return []
+    enc = tok(inputs, truncation=True, max_length=max_length)
+    ids, mask = enc["input_ids"], enc["attention_mask"]
+
+    def run(rows):
+        batch = tok.pad({"input_ids": [ids[i] for i in rows], "attention_mask": [mask[i] for i in rows]}, return_tensors="pt").to(dev)
+        with torch.inference_mode():
+            generated = mdl.generate(**batch, **gen)
+        return tok.batch_decode(generated, skip_special_tokens=True), batch["input_ids"].numel()
+
+    return run_bucketed(name, [len(x) for x in ids], run)
+
+def t5_generate(prompts: List[str]) -> List[str]:
+    q_tok, q_mdl, q_dev = load_t5()
+    return _generate("t5", q_tok, q_mdl, q_dev, prompts, 256, **T5_GEN_CONFIG)
+
+def grammar_generate(inputs: List[str]) -> List[str]:
+    g_tok, g_mdl = load_grammar()
+    _, _, q_dev = load_t5()
+    return _generate("grammar", g_tok, g_mdl, q_dev, inputs, 128, num_beams=2, early_stopping=True, max_length=128)
+
+@lru_cache()
+def qa_engines() -> List[BatchedQA]:
+    return [BatchedQA(tok, mdl, dev, window_batch=QA_WINDOW_BATCH) for tok, mdl, dev in load_qa()]
+
+class _Encoder:
+    """SBERT under inference_mode; torch stays out of callers, which may be
+    thin model-server clients."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def encode(self, texts: List[str], **kwargs):
+        import torch
+        with torch.inference_mode():
+            return self.model.encode(texts, **kwargs)
+
+def encoder() -> _Encoder:
+    return _Encoder(load_sbert())
+
+def warmup(use_qa: bool = True) -> None:
+    load_t5()
+    load_grammar()
+    if use_qa:
+        qa_engines()
+    load_sbert()
@@ -0,0 +1,181 @@
+"""Single owner of the model weights for all API workers on a host.
+
+    python -m app.model_quiz.model_server &
+    uvicorn app.main:app --workers 8
+
+With `model_server.enabled`, quiz_model sends T5, grammar, QA and SBERT
+calls here over a Unix socket instead of loading the models itself, so
+resident memory stays one copy of the weights however many workers run.
+Calls from different workers are merged by the server's MicroBatchers.
+
+The connection exchanges pickles, so only the server's user may reach it:
+each start generates a fresh auth key, written to `model_server.key_file`
+with mode 0600, and the socket itself is created 0600.
+"""
+
+import os
+import sys
+import time
+import secrets
+import socket
+import logging
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+from typing import Any, Callable, Dict, List
+
+from .config_model import MODEL_SERVER_SOCKET, MODEL_SERVER_KEY_FILE, MODEL_SERVER_TIMEOUT, USE_BATCHING, BATCH_WINDOW_MS, MAX_BATCH_SIZE
+
+logger = logging.getLogger("model.server")
+
+
+def _handlers() -> Dict[str, Callable]:
+    from . import inference_model as local
+    from .batching_model import MicroBatcher
+
+    t5, grammar = local.t5_generate, local.grammar_generate
+    if USE_BATCHING:
+        t5 = MicroBatcher(t5, BATCH_WINDOW_MS, MAX_BATCH_SIZE, name="t5-batcher")
+        grammar = MicroBatcher(grammar, BATCH_WINDOW_MS, MAX_BATCH_SIZE, name="grammar-batcher")
+    return {
+        "t5": t5,
+        "grammar": grammar,
+        "qa": lambda i, questions, contexts: local.qa_engines()[i](questions, contexts),
+        "qa_count": lambda: len(local.qa_engines()),
+        "encode": lambda texts, kwargs: local.encoder().encode(texts, **kwargs),
+        "warmup": local.warmup,
+        "token_stats": local.token_stats,
+    }
+
+
+def _serve_conn(conn, handlers: Dict[str, Callable]) -> None:
+    with conn:
+        while True:
+            try:
+                method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                conn.send(("ok", handlers[method](*args)))
+            except Exception as e:
+                logger.exception("Model server call %s failed", method)
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _write_key(key_file: str) -> bytes:
+    key = secrets.token_bytes(32)
+    os.makedirs(os.path.dirname(os.path.abspath(key_file)), exist_ok=True)
+    tmp = f"{key_file}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    os.replace(tmp, key_file)
+    return key
+
+
+def serve(path: str = MODEL_SERVER_SOCKET, key_file: str = MODEL_SERVER_KEY_FILE) -> None:
+    # nothing this process creates (socket, key) is readable by other users
+    os.umask(0o077)
+    handlers = _handlers()
+    logger.info("Loading models")
+    handlers["warmup"]()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    authkey = _write_key(key_file)
+    with Listener(path, family="AF_UNIX", authkey=authkey) as listener:
+        os.chmod(path, 0o600)
+        logger.info("Model server listening on %s", path)
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_conn, args=(conn, handlers), daemon=True).start()
+
+
+class _RemoteQA:
+    def __init__(self, client: "ModelClient", index: int):
+        self.client = client
+        self.index = index
+
+    def __call__(self, questions: List[str], contexts: List[str]):
+        return self.client.call("qa", self.index, questions, contexts)
+
+
+class _RemoteEncoder:
+    def __init__(self, client: "ModelClient"):
+        self.client = client
+
+    def encode(self, texts: List[str], **kwargs):
+        return self.client.call("encode", list(texts), kwargs)
+
+
+class ModelClient:
+    """Same surface as `inference_model`, backed by a model server.
+
+    Each calling thread keeps its own connection, so the QA fan-out and the
+    MicroBatchers in the API worker never share a socket.
+    """
+
+    def __init__(self, path: str = MODEL_SERVER_SOCKET, key_file: str = MODEL_SERVER_KEY_FILE):
+        self.path = path
+        self.key_file = key_file
+        self._local = threading.local()
+        self._qa = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # re-read on every connect: a restarted server has a new key
+            with open(self.key_file, "rb") as f:
+                authkey = f.read()
+            conn = self._local.conn = Client(self.path, family="AF_UNIX", authkey=authkey)
+        return conn
+
+    def call(self, method: str, *args) -> Any:
+        for attempt in (0, 1):
+            try:
+                conn = self._conn()
+                conn.send((method, args))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError, AuthenticationError) as e:
+                # server restarted: drop the stale connection and retry once
+                self._local.conn = None
+                if attempt:
+                    raise RuntimeError(f"Model server unavailable at {self.path}: {e}")
+        if status != "ok":
+            raise RuntimeError(f"Model server error: {result}")
+        return result
+
+    def t5_generate(self, prompts: List[str]) -> List[str]:
+        return self.call("t5", prompts)
+
+    def grammar_generate(self, inputs: List[str]) -> List[str]:
+        return self.call("grammar", inputs)
+
+    def qa_engines(self) -> List[_RemoteQA]:
+        if self._qa is None:
+            self._qa = [_RemoteQA(self, i) for i in range(self.call("qa_count"))]
+        return self._qa
+
+    def encoder(self) -> _RemoteEncoder:
+        return _RemoteEncoder(self)
+
+    def token_stats(self):
+        return self.call("token_stats")
+
+    def warmup(self, use_qa: bool = True, timeout: float = MODEL_SERVER_TIMEOUT) -> None:
+        """Wait for the server socket, then make sure its models are loaded."""
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(self.path):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Model server socket {self.path} did not appear within {timeout:.0f}s")
+            time.sleep(0.5)
+        self.call("warmup", use_qa)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="[%(asctime)s] [%(levelname)s] %(message)s", level=logging.INFO)
+    if not hasattr(socket, "AF_UNIX"):
+        sys.exit("model_server needs Unix domain sockets")
+    serve()
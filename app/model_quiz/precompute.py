@@ -0,0 +1,92 @@
+"""Materialise the model-mode question bank offline.
+
+Runs generation, grammar correction, QA and distractor ranking over every
+Model.json item for both question types and writes the gzip artifact read
+by `serving_mode: "precomputed"`.
+
+    python -m app.model_quiz.precompute --workers 4 --batch-size 32
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any
+
+from app.model_quiz.config_model import PRECOMPUTED_PATH
+from app.model_quiz.bank_model import item_key, save_bank
+
+logger = logging.getLogger("model.precompute")
+
+TYPES = ("mcq", "short_answer")
+
+
+def _init_worker(threads: int):
+    from app.model_quiz.config_model import TORCH_THREADS
+    from app.model_quiz.loaders_model import configure_threads
+    # an explicit torch_threads.intra in config.json wins over the even split
+    configure_threads(TORCH_THREADS.get("intra") or threads)
+
+
+def _run_chunk(items: List[Dict[str, Any]]) -> Dict[str, Dict[str, list]]:
+    from app.model_quiz import quiz_model
+
+    by_goal: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        by_goal.setdefault(item.get("goal", ""), []).append(item)
+
+    out: Dict[str, Dict[str, list]] = {}
+    for goal, group in by_goal.items():
+        contexts = [q["context"].strip() for q in group] * len(TYPES)
+        orig_ans = [q["correct_answer"].strip() for q in group] * len(TYPES)
+        types = [t for t in TYPES for _ in group]
+        pools = [q.get("distractors", []) for q in group] * len(TYPES)
+
+        questions, answers = quiz_model.generate_items(goal, contexts, orig_ans, types)
+        dists = quiz_model.get_distractors(answers, pools)
+        for i, t in enumerate(types):
+            item = group[i % len(group)]
+            out.setdefault(item_key(item), {})[t] = [questions[i], answers[i], dists[i] if t == "mcq" else []]
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the model-mode question bank.")
+    parser.add_argument("--output", default=PRECOMPUTED_PATH)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    # imported here so --help stays cheap
+    from app.model_quiz.quiz_model import dataset, gen_cache
+
+    items = dataset.items
+    chunks = [items[i:i + args.batch_size] for i in range(0, len(items), args.batch_size)]
+    logger.info("Precomputing %d items in %d chunks with %d worker(s)", len(items), len(chunks), args.workers)
+
+    entries: Dict[str, Dict[str, list]] = {}
+    start = time.perf_counter()
+    if args.workers <= 1:
+        for n, chunk in enumerate(chunks, 1):
+            entries.update(_run_chunk(chunk))
+            logger.info("  %d/%d chunks", n, len(chunks))
+    else:
+        threads = max(1, (os.cpu_count() or 1) // args.workers)
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker, initargs=(threads,)) as pool:
+            futures = [pool.submit(_run_chunk, chunk) for chunk in chunks]
+            for n, fut in enumerate(as_completed(futures), 1):
+                entries.update(fut.result())
+                logger.info("  %d/%d chunks", n, len(chunks))
+
+    save_bank(args.output, gen_cache.namespace, entries)
+    logger.info("Wrote %d items to %s in %.1fs", len(entries), args.output, time.perf_counter() - start)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format="[%(asctime)s] [%(levelname)s] %(message)s", level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from app import metrics
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+class BatchedQA:
+    """Extractive QA over a whole batch, `window_batch` windows per forward pass.
+
+    Span selection mirrors the `question-answering` pipeline: contexts longer
+    than `max_length` are split into windows overlapping by `doc_stride`
+    tokens, logits outside the context (except CLS) are masked, start/end
+    are softmaxed, CLS is then zeroed, and the best span of at most
+    `max_answer_len` tokens maximises p(start) * p(end). Like the pipeline,
+    only the `top_k` most likely starts and ends are paired, so no window
+    materialises its full length x length score matrix. Each question keeps
+    its best-scoring window.
+    """
+
+    def __init__(self, tok, mdl, device, max_length: int = 384, max_answer_len: int = 15, doc_stride: int = 128,
+                 window_batch: int = 32, top_k: int = 20):
+        self.tok = tok
+        self.mdl = mdl
+        self.device = device
+        self.max_length = max_length
+        self.max_answer_len = max_answer_len
+        self.doc_stride = doc_stride
+        self.window_batch = max(1, window_batch)
+        self.top_k = top_k
+
+    def _decode(self, p_start: np.ndarray, p_end: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Best (start, end, score) per window from its top-k starts and ends."""
+        n, length = p_start.shape
+        k = min(self.top_k, length)
+        starts = np.argpartition(-p_start, k - 1, axis=1)[:, :k]
+        ends = np.argpartition(-p_end, k - 1, axis=1)[:, :k]
+        width = ends[:, None, :] - starts[:, :, None]
+        valid = (width >= 0) & (width < self.max_answer_len)
+        cand = np.take_along_axis(p_start, starts, 1)[:, :, None] * np.take_along_axis(p_end, ends, 1)[:, None, :]
+        cand = np.where(valid, cand, -1.0).reshape(n, -1)
+
+        flat = cand.argmax(axis=1)
+        rows = np.arange(n)
+        si, ei = np.divmod(flat, k)
+        # no valid pair among the top-k: the window offers no answer
+        return starts[rows, si], ends[rows, ei], np.maximum(cand[rows, flat], 0.0)
+
+    def __call__(self, questions: List[str], contexts: List[str]) -> Tuple[List[str], np.ndarray]:
+        if not questions:
+            return [], np.zeros(0, dtype=np.float32)
+        metrics.observe_batch("qa", len(questions))
+
+        enc = self.tok(
+            questions, contexts, truncation="only_second", padding=True,
+            max_length=self.max_length, stride=self.doc_stride, return_overflowing_tokens=True,
+            return_offsets_mapping=True, return_tensors="pt",
+        )
+        offsets = enc["offset_mapping"].numpy()
+        # window -> question it was cut from
+        sample = enc["overflow_to_sample_mapping"].numpy()
+        ctx_mask = np.array([[sid == 1 for sid in enc.sequence_ids(i)] for i in range(len(sample))])
+        if self.tok.cls_token_id is not None:
+            cls_mask = enc["input_ids"].numpy() == self.tok.cls_token_id
+        else:
+            cls_mask = np.zeros_like(ctx_mask)
+        # CLS stays in the softmax denominator, as in the pipeline, and is
+        # only excluded from span selection afterwards
+        keep = ctx_mask | cls_mask
+        names = [k for k in self.tok.model_input_names if k in enc]
+
+        import torch
+        s_idx = np.zeros(len(sample), dtype=np.int64)
+        e_idx = np.zeros(len(sample), dtype=np.int64)
+        window_scores = np.zeros(len(sample))
+        for lo in range(0, len(sample), self.window_batch):
+            hi = lo + self.window_batch
+            inputs = {k: enc[k][lo:hi].to(self.device) for k in names}
+            with torch.inference_mode():
+                out = self.mdl(**inputs)
+            p_start = _softmax(np.where(keep[lo:hi], out.start_logits.float().cpu().numpy(), -10000.0))
+            p_end = _softmax(np.where(keep[lo:hi], out.end_logits.float().cpu().numpy(), -10000.0))
+            p_start[cls_mask[lo:hi]] = 0.0
+            p_end[cls_mask[lo:hi]] = 0.0
+            s_idx[lo:hi], e_idx[lo:hi], window_scores[lo:hi] = self._decode(p_start, p_end)
+
+        answers = [""] * len(questions)
+        scores = np.zeros(len(questions), dtype=np.float32)
+        best = np.full(len(questions), -1.0)
+        for w, q in enumerate(sample):
+            if window_scores[w] > best[q]:
+                best[q] = window_scores[w]
+                scores[q] = window_scores[w]
+                answers[q] = contexts[q][offsets[w, s_idx[w], 0]:offsets[w, e_idx[w], 1]].strip() if window_scores[w] > 0 else ""
+        return answers, scores
@@ -1,94 +1,368 @@
+import os
+import re
 import random
 import json
-from typing import List, Dict, Any
-from .loaders_model import load_t5, load_grammar, load_qa, load_sbert
-from .data_model import load_dataset, filter_dataset
-from sentence_transformers import util
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple, Union
+from app import metrics
+from app.normalize import normalize_difficulty, normalize_goal
+from app.sessions import open_store, sample_unserved
+from . import inference_model
+from .data_model import DatasetStore
+from .embeddings_model import EmbeddingStore
+from .qa_model import BatchedQA
+from .batching_model import MicroBatcher
+from .cache_model import GenerationCache
+from .bank_model import QuestionBank
 
-from .config_model import SUPPORTED_GOALS, SUPPORTED_DIFFICULTIES, DEFAULT_NUM_QUESTIONS, MAX_NUM_QUESTIONS, INPUT_PATH, QG_TEMPLATE, T5_GEN_CONFIG, USE_QA
+from .config_model import SUPPORTED_GOALS, SUPPORTED_DIFFICULTIES, INPUT_PATH, QG_TEMPLATE, T5_GEN_CONFIG, USE_QA, QA_THRESHOLD, QA_STRATEGY, SBERT_PATH, EMBEDDING_CACHE_DIR, USE_BATCHING, BATCH_WINDOW_MS, MAX_BATCH_SIZE
+from .config_model import T5_MODEL_PATH, GRAMMAR_MODEL_PATH, QA_MODEL_PATHS, GENERATION_CACHE_SIZE, GENERATION_CACHE_PATH, GENERATION_CACHE_MAX_ROWS, SERVING_MODE, PRECOMPUTED_PATH, STREAM_CHUNK_SIZE, PRECISION, MODEL_SERVER_ENABLED, GRAMMAR_PRECHECK, SESSIONS, INFERENCE_EXECUTOR
 
-q_tok, q_mdl, q_dev = load_t5()
-g_tok, g_mdl = load_grammar()
-qa_models = load_qa()
-sbert = load_sbert()
+logger = logging.getLogger("model.quiz")
 
-def generate_questions(contexts: List[str], answers: List[str], goal: str, types: List[str]) -> List[str]:
-    prompts = [QG_TEMPLATE.format(goal=goal, context=c, answer=(c if t == "short_answer" else a)) for c, a, t in zip(contexts, answers, types)]
-    inputs = q_tok(prompts, return_tensors="pt", truncation=True, padding=True, max_length=256).to(q_dev)
-    out = q_mdl.generate(**inputs, **T5_GEN_CONFIG)
-    return q_tok.batch_decode(out, skip_special_tokens=True)
+dataset = DatasetStore(INPUT_PATH)
+sessions = open_store(SESSIONS, processes=INFERENCE_EXECUTOR == "process")
+qa_pool = ThreadPoolExecutor(max_workers=max(1, len(QA_MODEL_PATHS)), thread_name_prefix="qa")
+# anything that changes generated text must be part of the namespace
+gen_cache = GenerationCache(
+    json.dumps([T5_MODEL_PATH, GRAMMAR_MODEL_PATH, QA_MODEL_PATHS, QG_TEMPLATE, T5_GEN_CONFIG, USE_QA, QA_THRESHOLD, QA_STRATEGY, PRECISION, GRAMMAR_PRECHECK], sort_keys=True),
+    GENERATION_CACHE_SIZE,
+    GENERATION_CACHE_PATH,
+    GENERATION_CACHE_MAX_ROWS,
+)
 
+bank = None
+if SERVING_MODE == "precomputed":
+    if os.path.isfile(PRECOMPUTED_PATH):
+        bank = QuestionBank(PRECOMPUTED_PATH, gen_cache.namespace)
+    else:
+        logger.warning("serving_mode is 'precomputed' but %s is missing; generating live", PRECOMPUTED_PATH)
+
+# Models are loaded on first use so a precomputed deployment never pays for
+# weights it only needs on the regenerate path. With a model server they are
+# not loaded in this process at all.
+if MODEL_SERVER_ENABLED:
+    from .model_server import ModelClient
+    models = ModelClient()
+else:
+    models = inference_model
+
+_t5_generate, _grammar_generate = models.t5_generate, models.grammar_generate
+
+def qa_engines() -> List[BatchedQA]:
+    return models.qa_engines()
+
+@lru_cache()
+def embedding_store() -> EmbeddingStore:
+    return EmbeddingStore(models.encoder(), f"{SBERT_PATH}|{PRECISION['sbert']}", EMBEDDING_CACHE_DIR)
+
+# prompts from concurrent requests share one generate() call per model; the
+# model server already batches across workers, so clients send straight through
+if USE_BATCHING and not MODEL_SERVER_ENABLED:
+    t5_generate = MicroBatcher(_t5_generate, BATCH_WINDOW_MS, MAX_BATCH_SIZE, name="t5-batcher")
+    grammar_generate = MicroBatcher(_grammar_generate, BATCH_WINDOW_MS, MAX_BATCH_SIZE, name="grammar-batcher")
+else:
+    t5_generate, grammar_generate = _t5_generate, _grammar_generate
+
+def _goals(goal: Union[str, List[str]], n: int) -> List[str]:
+    return [goal] * n if isinstance(goal, str) else list(goal)
+
+@metrics.traced("t5")
+def generate_questions(contexts: List[str], answers: List[str], goal: Union[str, List[str]], types: List[str]) -> List[str]:
+    goals = _goals(goal, len(contexts))
+    prompts = [QG_TEMPLATE.format(goal=g, context=c, answer=(c if t == "short_answer" else a)) for g, c, a, t in zip(goals, contexts, answers, types)]
+    return t5_generate(prompts)
+
+_MALFORMED = re.compile(r"\s{2,}|\s[?,.;:]|\b(\w+)\s+\1\b|[?.!]\S", re.IGNORECASE)
+
+def well_formed(question: str) -> bool:
+    """Cheap check for questions the grammar model would leave as they are:
+    capitalised, a single trailing '?', and no doubled words or stray spacing."""
+    q = question.strip()
+    return len(q) > 1 and q[0].isupper() and q.endswith("?") and q.count("?") == 1 and not _MALFORMED.search(q)
+
+@metrics.traced("grammar")
 def correct_grammar(questions: List[str]) -> List[str]:
-    inputs = ["gec: " + q for q in questions]
-    enc = g_tok(inputs, return_tensors="pt", truncation=True, padding=True, max_length=128).to(q_dev)
-    out = g_mdl.generate(**enc, num_beams=2, early_stopping=True, max_length=128)
-    return g_tok.batch_decode(out, skip_special_tokens=True)
+    if not GRAMMAR_PRECHECK:
+        return grammar_generate(["gec: " + q for q in questions])
+    out = list(questions)
+    todo = [i for i, q in enumerate(questions) if not well_formed(q)]
+    if todo:
+        for i, fixed in zip(todo, grammar_generate(["gec: " + questions[i] for i in todo])):
+            out[i] = fixed
+    logger.debug("grammar pre-check skipped %d/%d questions", len(questions) - len(todo), len(questions))
+    return out
 
+def _run_qa(model: BatchedQA, questions: List[str], contexts: List[str]):
+    try:
+        return model(questions, contexts)
+    except Exception:
+        return None
+
+
+@metrics.traced("qa")
 def extract_answers_with_qa(contexts: List[str], questions: List[str], originals: List[str]) -> List[str]:
-    final = []
-    for ctx, q, orig in zip(contexts, questions, originals):
-        best, best_score = orig, 0.0
+    qa_models = qa_engines()
+    best, best_score = list(originals), [0.0] * len(originals)
+
+    def merge(output, rows):
+        if output is None:
+            return
+        for i, ans, score in zip(rows, *output):
+            if score > best_score[i]:
+                best[i], best_score[i] = ans, float(score)
+
+    if QA_STRATEGY == "first_wins":
+        # later models only see the items earlier models were unsure about
+        rows = list(range(len(questions)))
         for model in qa_models:
-            try:
-                output = model(question=q, context=ctx)
-                if output["score"] > best_score:
-                    best, best_score = output["answer"], output["score"]
-            except Exception:
-                continue
-        final.append(best if best_score > 0.3 else orig)
-    return final
+            if not rows:
+                break
+            merge(_run_qa(model, [questions[i] for i in rows], [contexts[i] for i in rows]), rows)
+            rows = [i for i in rows if best_score[i] <= QA_THRESHOLD]
+    else:
+        rows = list(range(len(questions)))
+        for output in qa_pool.map(lambda m: _run_qa(m, questions, contexts), qa_models):
+            merge(output, rows)
+
+    return [b if s > QA_THRESHOLD else o for b, s, o in zip(best, best_score, originals)]
 
 
+@metrics.traced("distractors")
 def get_distractors(answers: List[str], pools: List[List[str]], top_k: int=3) -> List[List[str]]:
-    # sbert = _load_sbert()
-    ans_emb = sbert.encode(answers, convert_to_tensor=True)
-    result = []
-    for i,pool in enumerate(pools):
-        if not pool:
-            result.append([])
-            continue
-        d_emb = sbert.encode(pool, convert_to_tensor=True)
-        sims = util.pytorch_cos_sim(ans_emb[i], d_emb).squeeze()
-        top_idxs = sims.argsort(descending=True)[:top_k]
-        result.append([pool[idx] for idx in top_idxs])
-    return result
-
-
-def run_model_quiz(goal: str, difficulty: str, num_q: int) -> Dict[str, Any]:
+    embeddings = embedding_store()
+    embeddings.sync(dataset.items, dataset.version)
+    return embeddings.rank(answers, pools, top_k)
+
+
+def generate_items(goal: Union[str, List[str]], contexts: List[str], orig_ans: List[str], types: List[str]):
+    """Question and answer per item; only cache misses reach the models."""
+    goals = _goals(goal, len(contexts))
+    keys = [gen_cache.key(g, c, a, t) for g, c, a, t in zip(goals, contexts, orig_ans, types)]
+    with metrics.stage("cache"):
+        found = gen_cache.get_many(keys)
+    miss = [i for i, v in enumerate(found) if v is None]
+    if miss:
+        m_ctx = [contexts[i] for i in miss]
+        m_ans = [orig_ans[i] for i in miss]
+        questions = correct_grammar(generate_questions(m_ctx, m_ans, [goals[i] for i in miss], [types[i] for i in miss]))
+        answers = extract_answers_with_qa(m_ctx, questions, m_ans) if USE_QA else m_ans
+        fresh = {}
+        for i, q, a in zip(miss, questions, answers):
+            found[i] = fresh[keys[i]] = (q, a)
+        gen_cache.put_many(fresh)
+    return [q for q, _ in found], [a for _, a in found]
+
+
+def cache_stats() -> Dict[str, Any]:
+    return gen_cache.stats()
+
+
+def _collect_metrics():
+    stats = gen_cache.stats()
+    yield "quiz_generation_cache_hits_total", "counter", "Generation cache hits.", {}, stats["hits"]
+    yield "quiz_generation_cache_misses_total", "counter", "Generation cache misses.", {}, stats["misses"]
+    if dataset.load_stats is not None:
+        yield "quiz_records_skipped", "gauge", "Rows rejected by the last load of a bank file.", {"source": "model"}, dataset.load_stats.skipped
+    if sessions is not None:
+        yield "quiz_sessions", "gauge", "Sessions with served-question history.", {}, len(sessions)
+    if bank is None and not MODEL_SERVER_ENABLED:
+        for model, s in inference_model.token_stats().items():
+            for kind in ("real", "padded", "unbucketed"):
+                yield "quiz_input_tokens_total", "counter", "Input tokens fed to generate().", {"model": model, "kind": kind}, s[kind]
+
+metrics.register_collector(_collect_metrics)
+
+
+def dataset_version() -> int:
+    """Version of Model.json as on disk, without re-reading it."""
+    return os.stat(INPUT_PATH).st_mtime_ns
+
+
+def reload_dataset() -> Dict[str, Any]:
+    """Re-read Model.json now instead of on the next request's mtime check."""
+    changed = dataset.refresh()
+    return {"rows": len(dataset.items), "reloaded": changed, "skipped": dataset.load_stats.skipped}
+
+
+def warmup() -> None:
+    """Load whatever the configured serving path will touch on a request."""
+    dataset.refresh()
+    if bank is not None:
+        # precomputed: models stay unloaded until a bank miss needs them
+        return
+    models.warmup(USE_QA)
+    embedding_store().sync(dataset.items, dataset.version)
+
+
+@metrics.traced("plan")
+def plan_quiz(goal: str, difficulty: str, num_q: int, session_id: Optional[str] = None, seed: Optional[int] = None) -> Dict[str, Any]:
     if goal not in SUPPORTED_GOALS or difficulty not in SUPPORTED_DIFFICULTIES:
         raise ValueError(f"Invalid goal or difficulty: {goal}, {difficulty}")
 
-    pool = filter_dataset(load_dataset(INPUT_PATH), goal, difficulty)
+    version = dataset.version
+    pool = dataset.pool(goal, difficulty)
     if not pool:
         raise RuntimeError("No matching samples found")
 
-    selected = random.sample(pool, min(num_q, len(pool)))
-    contexts = [q["context"].strip() for q in selected]
-    orig_ans = [q["correct_answer"].strip() for q in selected]
-    distractor_pools = [q.get("distractors", []) for q in selected]
+    # a seeded quiz draws only from its own generator, so it is reproducible
+    rng = random.Random(seed) if seed is not None else random
+    if session_id and sessions is not None:
+        # items this session has not been served yet, O(num_q)
+        scope = f"model:{normalize_goal(goal)}|{normalize_difficulty(difficulty)}"
+        def pick(served):
+            rows, wrapped = sample_unserved(len(pool), num_q, served, rng)
+            return rows, rows, wrapped
 
+        rows = sessions.draw(session_id, scope, version, pick)
+        selected = [pool[i] for i in rows]
+        drawn = (session_id, scope, version, rows)
+    else:
+        selected = rng.sample(pool, min(num_q, len(pool)))
+        drawn = None
     mcq_count = max(1, int(num_q * 0.6))
     types = ["mcq"] * mcq_count + ["short_answer"] * (num_q - mcq_count)
-    random.shuffle(types)
-
-    questions = correct_grammar(generate_questions(contexts, orig_ans, goal, types))
-    answers = extract_answers_with_qa(contexts, questions, orig_ans) if USE_QA else orig_ans
-    dists = get_distractors(answers, distractor_pools)
-
-    quiz = []
-    for i, item in enumerate(selected):
-        qtype = types[i]
-        entry = {
-            "type": qtype,
-            "question": questions[i],
-            "answer": answers[i] if qtype == "mcq" else contexts[i],
-            "topic": item.get("topic", ""),
-            "difficulty": item.get("difficulty", "")
-        }
-        if qtype == "mcq":
-            opts = list(dict.fromkeys(dists[i] + [answers[i]]))
-            random.shuffle(opts)
-            entry["options"] = opts
-        quiz.append(entry)
-
-    return {"goal": goal, "difficulty": difficulty, "questions": quiz}
+    rng.shuffle(types)
+    return {"goal": goal, "difficulty": difficulty, "selected": selected, "types": types[:len(selected)], "rng": rng, "drawn": drawn}
+
+
+def release_plan(plan: Dict[str, Any], start: int = 0) -> None:
+    """Give items `start:` of a planned quiz back to its session.
+
+    Drawing marks rows as served up front so concurrent requests cannot pick
+    them; rows whose questions are never delivered (a model failure, a
+    client that went away) are unmarked again here.
+    """
+    if plan.get("drawn") is not None:
+        session_id, scope, version, rows = plan["drawn"]
+        if rows[start:]:
+            sessions.release(session_id, scope, version, rows[start:])
+
+
+def build_quizzes(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Materialise planned quizzes with one model pass over all their items."""
+    slots = [(p, i) for p in plans for i in range(len(p["selected"]))]
+    generated: Dict[Tuple[int, int], Tuple[str, str, List[str]]] = {}
+
+    todo = []
+    for p, i in slots:
+        hit = bank.get(p["selected"][i], p["types"][i]) if bank is not None else None
+        if hit is None:
+            todo.append((p, i))
+        else:
+            generated[id(p), i] = hit
+
+    # live path: everything when serving live, only bank misses otherwise
+    if todo:
+        items = [p["selected"][i] for p, i in todo]
+        orig_ans = [q["correct_answer"].strip() for q in items]
+        qs, ans = generate_items(
+            [p["goal"] for p, _ in todo],
+            [q["context"].strip() for q in items],
+            orig_ans,
+            [p["types"][i] for p, i in todo],
+        )
+        ds = get_distractors(ans, [q.get("distractors", []) for q in items])
+        for (p, i), q, a, d in zip(todo, qs, ans, ds):
+            generated[id(p), i] = (q, a, d)
+
+    results = []
+    for p in plans:
+        quiz = []
+        for i, item in enumerate(p["selected"]):
+            qtype = p["types"][i]
+            question, answer, dists = generated[id(p), i]
+            entry = {
+                "type": qtype,
+                "question": question,
+                "answer": answer if qtype == "mcq" else item["context"].strip(),
+                "topic": item.get("topic", ""),
+                "difficulty": item.get("difficulty", "")
+            }
+            if qtype == "mcq":
+                opts = list(dict.fromkeys(dists + [answer]))
+                p["rng"].shuffle(opts)
+                entry["options"] = opts
+            quiz.append(entry)
+        results.append({"goal": p["goal"], "difficulty": p["difficulty"], "questions": quiz})
+    return results
+
+
+def run_model_quiz(goal: str, difficulty: str, num_q: int, session_id: Optional[str] = None, seed: Optional[int] = None) -> Dict[str, Any]:
+    plan = plan_quiz(goal, difficulty, num_q, session_id, seed)
+    try:
+        return build_quizzes([plan])[0]
+    except Exception:
+        release_plan(plan)
+        raise
+
+
+def iter_model_quiz(goal: str, difficulty: str, num_q: int, session_id: Optional[str] = None, seed: Optional[int] = None, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Yield question entries as soon as each small chunk is fully built.
+
+    The quiz is planned once, then every `chunk_size` items go through all
+    stages before the next chunk starts, so the first question does not wait
+    on the whole quiz.
+    """
+    plan = plan_quiz(goal, difficulty, num_q, session_id, seed)
+    sent = 0
+    try:
+        for start in range(0, len(plan["selected"]), max(1, chunk_size)):
+            end = start + max(1, chunk_size)
+            part = dict(plan, selected=plan["selected"][start:end], types=plan["types"][start:end])
+            for question in build_quizzes([part])[0]["questions"]:
+                sent += 1
+                yield question
+    finally:
+        # a failure or a closed stream leaves the rest undelivered
+        release_plan(plan, sent)
+
+
+def iter_model_quiz_batch(specs: Iterable[Tuple[str, str, int, Optional[str], Optional[int]]], chunk_size: int = MAX_BATCH_SIZE) -> Iterator[Tuple[int, Any]]:
+    """Yield (index, quiz or exception) for each spec, in completion order.
+
+    Quizzes are grouped until their items fill roughly one model batch, so
+    prompts from many small quizzes share each generate() call.
+    """
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+    size = 0
+    try:
+        for idx, (goal, difficulty, num_q, session_id, seed) in enumerate(specs):
+            try:
+                plan = plan_quiz(goal, difficulty, num_q, session_id, seed)
+            except (ValueError, RuntimeError) as e:
+                yield idx, e
+                continue
+            chunk.append((idx, plan))
+            size += len(plan["selected"])
+            if size >= chunk_size:
+                pending, chunk, size = chunk, [], 0
+                yield from _build_chunk(pending)
+        pending, chunk = chunk, []
+        yield from _build_chunk(pending)
+    finally:
+        # planned but never built: the stream was closed first
+        for _, plan in chunk:
+            release_plan(plan)
+
+
+def _build_chunk(chunk: List[Tuple[int, Dict[str, Any]]]) -> Iterator[Tuple[int, Any]]:
+    if not chunk:
+        return
+    # a model failure fails this group only; later groups still run
+    try:
+        quizzes = build_quizzes([p for _, p in chunk])
+    except Exception as e:
+        logger.exception("Batch group of %d quizzes failed", len(chunk))
+        quizzes = [e] * len(chunk)
+    sent = 0
+    try:
+        for (idx, _), quiz in zip(chunk, quizzes):
+            sent += 1
+            yield idx, quiz
+    finally:
+        for n, ((_, plan), quiz) in enumerate(zip(chunk, quizzes)):
+            if n >= sent or isinstance(quiz, Exception):
+                release_plan(plan)
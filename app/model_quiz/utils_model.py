@@ -1,7 +1,7 @@
 import random
-import torch
 import time
 def set_seed():
+    import torch
     seed = int(time.time() * 1000) % 100000
     random.seed(seed)
     torch.manual_seed(seed)
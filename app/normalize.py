@@ -0,0 +1,41 @@
+import re
+from typing import Any, Dict
+
+# Canonical spellings shared by both generator modes. Source files disagree
+# ("MCQ" / "mcq", "short answer" / "short_answer", "advance" / "advanced");
+# records are normalised once at load so lookups compare plain strings.
+
+TYPE_ALIASES = {
+    "mcq": "mcq",
+    "multiple choice": "mcq",
+    "short answer": "short_answer",
+}
+DIFFICULTY_ALIASES = {
+    "advance": "advanced",
+}
+
+_SEPARATORS = re.compile(r"[\s_\-]+")
+
+
+def normalize_goal(goal: str) -> str:
+    return " ".join(str(goal).lower().split())
+
+
+def normalize_difficulty(difficulty: str) -> str:
+    key = " ".join(str(difficulty).lower().split())
+    return DIFFICULTY_ALIASES.get(key, key)
+
+
+def normalize_type(qtype: str) -> str:
+    key = _SEPARATORS.sub(" ", str(qtype).lower()).strip()
+    return TYPE_ALIASES.get(key, key.replace(" ", "_"))
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of `record` with canonical type/difficulty; other fields untouched."""
+    out = dict(record)
+    if "type" in out:
+        out["type"] = normalize_type(out["type"])
+    if "difficulty" in out:
+        out["difficulty"] = normalize_difficulty(out["difficulty"])
+    return out
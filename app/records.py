@@ -0,0 +1,314 @@
+import io
+import re
+import sys
+import json
+import logging
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.normalize import normalize_record
+
+logger = logging.getLogger("records")
+
+# Streaming loader for question banks: JSON arrays and JSON Lines are parsed
+# one record at a time, each record is validated, bad ones are skipped and
+# counted, and the survivors are kept as compact Record objects.
+
+FIELDS = ("goal", "difficulty", "type", "topic", "subtopic", "context", "question", "answer", "options", "correct_answer", "distractors")
+# low-cardinality values shared by thousands of rows
+_INTERNED = ("goal", "difficulty", "type", "topic", "subtopic")
+
+# an element still failing to parse with this much text buffered is malformed,
+# not cut off at a chunk boundary
+_MAX_RECORD_CHUNKS = 8
+_NEXT_ELEMENT = re.compile(r",\s*\{")
+
+DIFFICULTIES = {"beginner", "intermediate", "advanced"}
+RETRIEVAL_SCHEMA = {
+    "required": ("question", "answer", "type", "difficulty"),
+    "lists": ("options",),
+    "enum": {"type": {"mcq", "short_answer"}, "difficulty": DIFFICULTIES},
+}
+MODEL_SCHEMA = {
+    "required": ("goal", "difficulty", "context", "correct_answer"),
+    "lists": ("distractors",),
+    "enum": {"difficulty": DIFFICULTIES},
+}
+
+
+class Record(Mapping):
+    """Read-only question record with a fixed slot per known field.
+
+    Behaves like the dict it replaces (`get`, `[]`, `in`, `dict(record)`);
+    fields missing from the source are absent, not None. Unknown keys are
+    kept in `extra`.
+    """
+
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, data: Dict[str, Any]):
+        extra = None
+        for key, value in data.items():
+            if key in _SLOTS:
+                if key in _INTERNED and isinstance(value, str):
+                    value = sys.intern(value)
+                object.__setattr__(self, key, value)
+            else:
+                extra = extra or {}
+                extra[key] = value
+        object.__setattr__(self, "extra", extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Record is read-only")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Record({dict(self)!r})"
+
+    def __reduce__(self):
+        return Record, (dict(self),)
+
+
+_SLOTS = frozenset(FIELDS)
+
+
+def validate(record: Any, schema: Dict[str, Any]) -> Optional[str]:
+    """Reason the record breaks `schema`, or None if it is usable."""
+    if not isinstance(record, dict):
+        return "not an object"
+    for key in schema.get("required", ()):
+        value = record.get(key)
+        if not isinstance(value, str) or not value.strip():
+            return f"missing {key}"
+    for key in schema.get("lists", ()):
+        value = record.get(key)
+        if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+            return f"bad {key}"
+    for key, allowed in schema.get("enum", {}).items():
+        if key in record and record[key] not in allowed:
+            return f"bad {key}"
+    return None
+
+
+def _skip_ws(buf: str, pos: int) -> int:
+    while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _iter_array(f: io.TextIOBase, buf: str, chunk: int) -> Iterator[Tuple[Any, Optional[str]]]:
+    """Yield (value, None) per element of a top-level array, or (None, error)
+    for an element that does not parse; parsing resumes at the next element."""
+    decoder = json.JSONDecoder()
+    pos = 1  # past '['
+    eof = False
+    while True:
+        pos = _skip_ws(buf, pos)
+        if pos < len(buf) and buf[pos] == ",":
+            pos = _skip_ws(buf, pos + 1)
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if not eof and len(buf) - pos < chunk * _MAX_RECORD_CHUNKS:
+                # the element may just be cut off at the chunk boundary
+                more = f.read(chunk)
+                buf, pos = buf[pos:] + more, 0
+                eof = not more
+                continue
+            if pos >= len(buf):
+                return
+            yield None, f"invalid JSON: {e.msg}"
+            nxt = _NEXT_ELEMENT.search(buf, pos)
+            while nxt is None and not eof:
+                more = f.read(chunk)
+                # keep a tail in case ",\s*{" straddles the boundary
+                buf, pos = buf[-chunk:] + more, 0
+                eof = not more
+                nxt = _NEXT_ELEMENT.search(buf, pos)
+            if nxt is None:
+                return
+            pos = nxt.end() - 1
+            continue
+        if end == len(buf) and not eof:
+            # a number or literal may continue in the next chunk
+            more = f.read(chunk)
+            buf, pos = buf[pos:] + more, 0
+            eof = not more
+            continue
+        yield value, None
+        pos = end
+        if len(buf) - pos < chunk // 2 and not eof:
+            more = f.read(chunk)
+            buf, pos = buf[pos:] + more, 0
+            eof = not more
+
+
+def _data_offset(buf: str, start: int) -> Optional[int]:
+    """Offset of the '[' opening the "data" array of the object at `start`.
+
+    Returns -1 when the object is complete (or malformed) without one, and
+    None when `buf` ends before either is known.
+    """
+    decoder = json.JSONDecoder()
+    pos = start + 1  # past '{'
+    while True:
+        pos = _skip_ws(buf, pos)
+        if pos == len(buf):
+            return None
+        if buf[pos] == "}":
+            return -1
+        try:
+            key, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            return None
+        pos = _skip_ws(buf, pos)
+        if pos == len(buf):
+            return None
+        if not isinstance(key, str) or buf[pos] != ":":
+            return -1
+        pos = _skip_ws(buf, pos + 1)
+        if pos == len(buf):
+            return None
+        if key == "data" and buf[pos] == "[":
+            return pos
+        try:
+            _, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            return None
+        pos = _skip_ws(buf, pos)
+        if pos == len(buf):
+            return None
+        if buf[pos] != ",":
+            return -1
+        pos += 1
+
+
+def iter_raw(path: str, chunk: int = 1 << 20) -> Iterator[Tuple[Any, Optional[str]]]:
+    """Stream top-level records from a JSON array, JSON Lines, or a
+    {"data": [...]} wrapper as (record, error) pairs.
+
+    A wrapper is streamed from its "data" array once the keys before it
+    have been parsed; if those take more than `_MAX_RECORD_CHUNKS` chunks,
+    the file is read whole instead.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk)
+        start = _skip_ws(buf, 0)
+        if buf[start:start + 1] == "[":
+            yield from _iter_array(f, buf[start:], chunk)
+            return
+
+        jsonl = path.endswith((".jsonl", ".ndjson"))
+        if buf[start:start + 1] == "{" and not jsonl:
+            at = _data_offset(buf, start)
+            while at is None and len(buf) - start < chunk * _MAX_RECORD_CHUNKS:
+                more = f.read(chunk)
+                if not more:
+                    break
+                buf += more
+                at = _data_offset(buf, start)
+            if at is not None and at >= 0:
+                yield from _iter_array(f, buf[at:], chunk)
+                return
+
+        rest = buf + f.read() if not jsonl else None
+        if rest is not None:
+            # a single object: the legacy {"data": [...]} wrapper
+            try:
+                whole = json.loads(rest)
+            except json.JSONDecodeError:
+                whole = None
+            if isinstance(whole, dict):
+                logger.info("%s: no \"data\" array near the start of the object; read it whole", path)
+                for value in whole.get("data", []):
+                    yield value, None
+                return
+            lines = io.StringIO(rest)
+        else:
+            lines = io.StringIO(buf)
+
+        for line in _chain_lines(lines, f if rest is None else None):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield None, f"invalid JSON: {e.msg}"
+
+
+def _chain_lines(head: io.StringIO, tail: Optional[io.TextIOBase]) -> Iterator[str]:
+    pending = ""
+    for line in head:
+        if line.endswith("\n"):
+            yield pending + line
+            pending = ""
+        else:
+            pending += line
+    if tail is not None:
+        for line in tail:
+            yield pending + line
+            pending = ""
+    if pending:
+        yield pending
+
+
+class LoadStats:
+    __slots__ = ("path", "loaded", "skipped", "reasons")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.loaded = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    def skip(self, reason: str) -> None:
+        self.skipped += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"loaded": self.loaded, "skipped": self.skipped, "reasons": dict(self.reasons)}
+
+
+def load_records(path: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[List[Record], LoadStats]:
+    """Normalised, validated Records from `path` plus load counts.
+
+    Rows that fail to parse or break `schema` are skipped, not fatal.
+    """
+    stats = LoadStats(path)
+    out: List[Record] = []
+    for value, error in iter_raw(path):
+        if error is None and isinstance(value, dict):
+            value = normalize_record(value)
+            error = validate(value, schema) if schema else None
+        elif error is None:
+            error = "not an object"
+        if error is not None:
+            stats.skip(error)
+            continue
+        out.append(Record(value))
+    stats.loaded = len(out)
+    if stats.skipped:
+        logger.warning("Skipped %d bad rows in %s: %s", stats.skipped, path, stats.reasons)
+    return out, stats
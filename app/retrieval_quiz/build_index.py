@@ -0,0 +1,25 @@
+"""Build the persisted retrieval index for every configured goal.
+
+    python -m app.retrieval_quiz.build_index
+
+Partitions whose domain file hash is unchanged are left as they are, so this
+is safe to run on every deploy.
+"""
+
+from app.retrieval_quiz.question_matcher import QuestionMatcher
+from app.retrieval_quiz.topic_extractor import TopicExtractor
+from app.retrieval_quiz.retrieval_config import CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger
+
+
+def main():
+    if not CONFIG.get("retrieval_index_dir"):
+        raise SystemExit("retrieval_index_dir is not set in config.json")
+    cfg = dict(CONFIG, retrieval_preload_goals=None)
+    extractor = TopicExtractor(CONFIG.get("spacy_model", "en_core_web_sm"))
+    matcher = QuestionMatcher(cfg, DATA_DIR, RETRIEVAL_GOALS, logger, extractor=extractor)
+    for key, part in matcher.partitions.items():
+        logger.info(f"{part.goal}: {len(part)} rows, {part.matrix.nnz} non-zeros")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from app.retrieval_quiz.question_matcher import QuestionMatcher
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def spherical_kmeans(vectors, nlist, iters=10, seed=0, block=65536):
+    """Cosine k-means on L2-normalised rows; returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = vectors[rng.choice(n, size=nlist, replace=False)].copy()
+    assign = np.zeros(n, dtype=np.int32)
+    for _ in range(iters):
+        for start in range(0, n, block):
+            assign[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # re-seed empty clusters so every list stays useful
+            sums[empty] = vectors[rng.choice(n, size=int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids, assign
+
+
+class IVFIndex:
+    """Inverted-file ANN index: rows are bucketed by nearest centroid and a
+    query only scans the rows of its `nprobe` closest centroids."""
+
+    def __init__(self, vectors, centroids, assign):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.assign = assign
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(len(centroids) + 1))
+
+    @classmethod
+    def build(cls, vectors, nlist=None, iters=10, seed=0):
+        nlist = min(len(vectors), nlist or max(1, int(np.sqrt(len(vectors)))))
+        centroids, assign = spherical_kmeans(vectors, nlist, iters, seed)
+        return cls(vectors, centroids, assign)
+
+    def extended(self, order, vectors):
+        """Index over old rows plus `vectors`, reordered by `order`; centroids are kept."""
+        vectors = _normalize(vectors) if len(vectors) else np.zeros((0, self.vectors.shape[1]), dtype=np.float32)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1).astype(self.assign.dtype) if len(vectors) else self.assign[:0]
+        return IVFIndex(
+            np.vstack([self.vectors, vectors])[order],
+            self.centroids,
+            np.concatenate([self.assign, assign])[order],
+        )
+
+    def probe(self, query, nprobe):
+        nprobe = min(nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+
+    def scores(self, rows, query, nprobe):
+        """Dense cosine for the probed subset of `rows`; rows outside it score 0."""
+        out = np.zeros(len(rows), dtype=np.float32)
+        hit = np.isin(rows, self.probe(query, nprobe))
+        out[hit] = self.vectors[rows[hit]] @ query
+        return out
+
+
+class DenseMatcher(QuestionMatcher):
+    """Hybrid backend: TF-IDF (plus topic boost) fused with sentence-embedding
+    similarity from a per-goal IVF index.
+
+    final = (1 - alpha) * tfidf + alpha * dense
+    """
+
+    def __init__(self, config, data_dir, retrieval_goals, logger, extractor=None, encoder=None):
+        hybrid = config.get("hybrid", {})
+        self.alpha = hybrid.get("alpha", 0.5)
+        self.nprobe = hybrid.get("nprobe", 8)
+        self.nlist = hybrid.get("nlist")
+        self.kmeans_iters = hybrid.get("kmeans_iters", 10)
+        self.encoder_path = config.get("sentence_transformer_path", "")
+        self._encoder = encoder
+        self._encode_one = lru_cache(maxsize=4096)(self._encode_text)
+        super().__init__(config, data_dir, retrieval_goals, logger, extractor=extractor)
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            from sentence_transformers import SentenceTransformer
+            self._encoder = SentenceTransformer(self.encoder_path)
+        return self._encoder
+
+    def encode(self, texts):
+        return _normalize(self.encoder.encode(list(texts), convert_to_numpy=True, batch_size=64))
+
+    def _encode_text(self, text):
+        return self.encode([text])[0]
+
+    def _open(self, name, path):
+        partition = super()._open(name, path)
+        partition.dense = self._dense_index(partition)
+        return partition
+
+    def _update(self, old, records):
+        partition, order, added = super()._update(old, records)
+        texts = [f"{q.get('context', '')} {q.get('question', '')}".strip() for q in added]
+        partition.dense = old.dense.extended(order, self.encode(texts) if texts else [])
+        return partition, order, added
+
+    def _dense_index(self, partition):
+        tag = hashlib.sha1(f"{self.encoder_path}|{self.nlist}|{self.kmeans_iters}".encode("utf-8")).hexdigest()[:12]
+        cache = os.path.join(partition.source_dir, f"dense-{tag}") if partition.source_dir else None
+        if cache and os.path.isfile(cache + ".vectors.npy"):
+            return IVFIndex(
+                np.load(cache + ".vectors.npy", mmap_mode="r"),
+                np.load(cache + ".centroids.npy"),
+                np.load(cache + ".assign.npy"),
+            )
+
+        texts = [f"{q.get('context', '')} {q.get('question', '')}".strip() for q in partition.bank]
+        vectors = self.encode(texts)
+        index = IVFIndex.build(vectors, self.nlist, self.kmeans_iters)
+        if cache:
+            # vectors go last: their presence marks a complete cache
+            for suffix, arr in (("centroids", index.centroids), ("assign", index.assign), ("vectors", vectors)):
+                tmp = f"{cache}.{os.getpid()}.tmp.npy"
+                np.save(tmp, arr)
+                os.replace(tmp, f"{cache}.{suffix}.npy")
+        return index
+
+    def score(self, part, rows, topic_lists):
+        sparse = super().score(part, rows, topic_lists)
+        dense = np.stack(
+            [part.dense.scores(rows, self._encode_one(" ".join(topics)), self.nprobe) for topics in topic_lists],
+            axis=1,
+        )
+        return (1 - self.alpha) * sparse + self.alpha * dense
@@ -1,10 +1,41 @@
-from app.retrieval_quiz.quiz_retrieval import QuizGenerator
+from functools import lru_cache
+from app.normalize import normalize_goal
 from app.retrieval_quiz.retrieval_config import CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger
 
-generator = QuizGenerator(CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger)
+# Built on first use (or by warmup()) so importing the API does not pull in
+# spaCy / scikit-learn or read the question banks.
+@lru_cache()
+def get_generator():
+    from app.retrieval_quiz.quiz_retrieval import QuizGenerator
+    generator = QuizGenerator(CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger)
+    watch = CONFIG.get("retrieval_reload", {})
+    if watch.get("watch"):
+        generator.matcher.watch(watch.get("interval", 5))
+    return generator
 
-def retrieve_quiz(goal: str, difficulty: str, num_questions: int):
-    return generator.retrieve_quiz(goal, difficulty, num_questions)
+def warmup():
+    get_generator()
+
+def reload(goal=None, refit=False):
+    matcher = get_generator().matcher
+    return [matcher.reload_goal(goal, refit)] if goal else matcher.reload(refit)
+
+def retrieve_quiz(goal: str, difficulty: str, num_questions: int, session_id: str = None, seed: int = None):
+    return get_generator().retrieve_quiz(goal, difficulty, num_questions, session_id, seed)
+
+def stream_quiz(goal: str, difficulty: str, num_questions: int, session_id: str = None, seed: int = None):
+    yield from get_generator().retrieve_quiz(goal, difficulty, num_questions, session_id, seed)
+
+def retrieve_quiz_batch(specs):
+    return get_generator().iter_retrieve_batch(specs)
+
+def version(goal: str):
+    """Identifies the data a quiz for `goal` is drawn from (keys the response
+    cache); None until the goal is loaded, so nothing is built on this path."""
+    if not get_generator.cache_info().currsize:
+        return None
+    part = get_generator().matcher.partitions.get(normalize_goal(goal))
+    return part.source_mtime if part is not None else None
 
 if __name__ == "__main__":
     import pprint
@@ -0,0 +1,118 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from app.records import Record, iter_raw
+
+FORMAT = 3
+ARRAYS = ("data", "indices", "indptr", "idf", "diff_codes", "type_codes", "topic_codes")
+
+
+def file_hash(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _slug(goal):
+    return re.sub(r"[^a-z0-9]+", "-", goal.lower()).strip("-")
+
+
+def partition_dir(index_dir, goal, digest):
+    return os.path.join(index_dir, f"{_slug(goal)}-v{FORMAT}-{digest[:16]}")
+
+
+def save_partition(index_dir, partition, digest):
+    """Write a fitted GoalPartition as plain .npy/.json files.
+
+    The directory name carries the source file hash; it is written under a
+    temporary name and renamed into place, so concurrent builders never
+    expose a partial index.
+    """
+    final = partition_dir(index_dir, partition.goal, digest)
+    if os.path.isdir(final):
+        return final
+
+    tmp = f"{final}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    m = partition.matrix.tocsr()
+    m.sort_indices()
+    arrays = {
+        "data": m.data.astype(np.float32),
+        "indices": m.indices,
+        "indptr": m.indptr,
+        "idf": partition.vectorizer.idf_.astype(np.float32),
+        "diff_codes": partition.diff_codes,
+        "type_codes": partition.type_codes,
+        "topic_codes": partition.topic_codes,
+    }
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), arr)
+
+    meta = {
+        "goal": partition.goal,
+        "source_sha256": digest,
+        "shape": list(m.shape),
+        "vocabulary": {t: int(i) for t, i in partition.vectorizer.vocabulary_.items()},
+        "diff_vocab": partition.diff_vocab,
+        "type_vocab": partition.type_vocab,
+        "topic_names": partition.topic_names,
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    with open(os.path.join(tmp, "records.json"), "w", encoding="utf-8") as f:
+        json.dump([dict(q) for q in partition.bank], f, ensure_ascii=False)
+    if partition.topics is not None:
+        with open(os.path.join(tmp, "topics.json"), "w", encoding="utf-8") as f:
+            json.dump(partition.topics, f, ensure_ascii=False)
+
+    try:
+        os.rename(tmp, final)
+    except OSError:
+        # another worker finished the same build first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    # older builds of this goal only: "<slug>-v<format>-<digest>", never
+    # another goal whose slug merely starts with this one
+    own = re.compile(rf"{re.escape(_slug(partition.goal))}-v\d+-[0-9a-f]{{16}}")
+    for name in os.listdir(index_dir):
+        stale = os.path.join(index_dir, name)
+        if own.fullmatch(name) and stale != final:
+            shutil.rmtree(stale, ignore_errors=True)
+    return final
+
+
+def load_partition(path):
+    """Open a saved partition with every array memory-mapped read-only."""
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    # written by save_partition from already-validated rows
+    records = [Record(q) for q, _ in iter_raw(os.path.join(path, "records.json"))]
+    topics = None
+    if os.path.isfile(os.path.join(path, "topics.json")):
+        with open(os.path.join(path, "topics.json"), "r", encoding="utf-8") as f:
+            topics = json.load(f)
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+
+    matrix = csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(meta["shape"]), copy=False)
+    vectorizer = TfidfVectorizer(stop_words="english", dtype=np.float32)
+    vectorizer.vocabulary_ = meta["vocabulary"]
+    vectorizer.idf_ = np.asarray(arrays["idf"])
+
+    columns = {
+        "diff_codes": arrays["diff_codes"],
+        "type_codes": arrays["type_codes"],
+        "topic_codes": arrays["topic_codes"],
+        "diff_vocab": meta["diff_vocab"],
+        "type_vocab": meta["type_vocab"],
+        "topic_names": meta["topic_names"],
+    }
+    return meta["goal"], records, vectorizer, matrix, columns, topics
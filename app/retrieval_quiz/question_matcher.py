@@ -1,86 +1,407 @@
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 import random
 import os
 import json
+import time
+import threading
+from scipy.sparse import vstack
+from app import metrics, sessions
+from app.normalize import normalize_difficulty, normalize_goal, normalize_type
+from app.records import RETRIEVAL_SCHEMA, load_records
+from app.retrieval_quiz import index_store
+
+
+def _record_key(record):
+    return json.dumps(dict(record), sort_keys=True, ensure_ascii=False)
+
+
+def _text(record):
+    return f"{record.get('context', '')} {record.get('question', '')}".strip()
+
+
+def _encode(values):
+    vocab = {}
+    codes = np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32, count=len(values))
+    return codes, vocab
+
+
+class GoalPartition:
+    """TF-IDF index over a single goal's questions.
+
+    Each partition fits its own vocabulary, so a query only touches the rows
+    and terms of the goal it asks for.
+    """
+
+    def __init__(self, goal, questions, vectorizer=None, matrix=None, columns=None, topics=None):
+        self.goal = goal
+        self.bank = questions
+        # spaCy topics per row, precomputed so seeds never hit the NLP pipeline
+        self.topics = topics
+        # persisted index directory this partition was opened from, if any
+        self.source_dir = None
+        # rows appended with the fitted vocabulary since the last full fit
+        self.pending = 0
+        self.fitted_at = time.time()
+        self.source_mtime = None
+
+        if vectorizer is None:
+            texts = [_text(q) for q in self.bank]
+            vectorizer = TfidfVectorizer(stop_words="english", dtype=np.float32)
+            matrix = vectorizer.fit_transform(texts)
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+
+        # metadata as categorical codes; every per-request filter works on these
+        if columns is None:
+            self.diff_codes, self.diff_vocab = _encode([normalize_difficulty(q.get("difficulty", "")) for q in self.bank])
+            self.type_codes, self.type_vocab = _encode([normalize_type(q.get("type", "")) for q in self.bank])
+            self.topic_codes, topic_vocab = _encode([q.get("topic", "").lower() for q in self.bank])
+            self.topic_names = list(topic_vocab)
+        else:
+            self.diff_codes, self.diff_vocab = columns["diff_codes"], columns["diff_vocab"]
+            self.type_codes, self.type_vocab = columns["type_codes"], columns["type_vocab"]
+            self.topic_codes, self.topic_names = columns["topic_codes"], columns["topic_names"]
+
+        # (difficulty, type) -> row ids, so candidate lookup is O(k)
+        keys = np.stack([self.diff_codes, self.type_codes], axis=1)
+        order = np.lexsort(keys.T[::-1])
+        uniq, starts = np.unique(keys[order], axis=0, return_index=True)
+        bounds = list(starts[1:]) + [len(order)]
+        self.groups = {tuple(int(c) for c in k): order[s:e] for k, s, e in zip(uniq, starts, bounds)}
+
+    def __len__(self):
+        return len(self.bank)
+
+    def updated(self, records, extractor=None, batch_size=256, n_process=1):
+        """New partition holding `records`, reusing this one's fitted vocabulary.
+
+        Unchanged records keep their TF-IDF rows and topics; only added or
+        edited ones are transformed (terms unseen at fit time are dropped
+        until the next full refit). Returns (partition, order, added) where
+        `order` maps each new row to a row of this partition's matrix
+        stacked on top of the added rows.
+        """
+        old = {}
+        for i, q in enumerate(self.bank):
+            old.setdefault(_record_key(q), []).append(i)
+
+        order, added = [], []
+        for q in records:
+            rows = old.get(_record_key(q))
+            if rows:
+                order.append(rows.pop())
+            else:
+                order.append(len(self.bank) + len(added))
+                added.append(q)
+        order = np.asarray(order, dtype=np.int64)
+
+        texts = [_text(q) for q in added]
+        matrix = vstack([self.matrix, self.vectorizer.transform(texts)]).tocsr()[order] if added else self.matrix[order]
+        topics = None
+        if self.topics is not None:
+            fresh = extractor.extract_many(texts, batch_size, n_process) if (added and extractor is not None) else [[] for _ in added]
+            stacked = list(self.topics) + list(fresh)
+            topics = [stacked[i] for i in order]
+
+        part = GoalPartition(self.goal, list(records), self.vectorizer, matrix, topics=topics)
+        part.pending = self.pending + len(added)
+        part.fitted_at = self.fitted_at
+        return part, order, added
+
+    def _groups_for(self, difficulty=None, q_types=None):
+        diffs = [self.diff_vocab.get(normalize_difficulty(difficulty), -1)] if difficulty else list(self.diff_vocab.values())
+        types = [self.type_vocab.get(normalize_type(t), -1) for t in q_types] if q_types else list(self.type_vocab.values())
+        return [self.groups[(d, t)] for d in diffs for t in types if (d, t) in self.groups]
+
+    def candidates(self, difficulty=None, q_types=None):
+        parts = self._groups_for(difficulty, q_types)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def sample(self, difficulty=None, q_types=None, rng=random):
+        """One random row id matching the filters, or None; O(groups), no row scan."""
+        parts = self._groups_for(difficulty, q_types)
+        r = rng.randrange(sum(len(p) for p in parts)) if parts else None
+        for p in parts:
+            if r < len(p):
+                return int(p[r])
+            r -= len(p)
+        return None
+
+    def topic_boost(self, topics):
+        hit = np.fromiter(
+            (any(t in name or name in t for t in topics) for name in self.topic_names),
+            dtype=bool, count=len(self.topic_names),
+        )
+        return 0.2 * hit
+
+    def score(self, rows, topics):
+        return self.score_many(rows, [topics])[:, 0]
+
+    def score_many(self, rows, topic_lists):
+        """Scores of `rows` against several queries, shape (len(rows), len(topic_lists))."""
+        # TF-IDF rows are L2-normalised, so cosine similarity is a sparse dot product
+        queries = self.vectorizer.transform([" ".join(topics) for topics in topic_lists])
+        scores = np.asarray((self.matrix[rows] @ queries.T).todense())
+        codes = self.topic_codes[rows]
+        for j, topics in enumerate(topic_lists):
+            scores[:, j] += self.topic_boost(topics)[codes]
+        return scores
+
+
 class QuestionMatcher:
-    def __init__(self, config, data_dir, retrieval_goals, logger):
-        self.bank = []
-        for goal, filename in config.get("domain_files", {}).items():
-            if goal.lower() not in retrieval_goals:
-                continue
+    def __init__(self, config, data_dir, retrieval_goals, logger, extractor=None):
+        self.logger = logger
+        self.extractor = extractor
+        self.spacy_batch_size = config.get("spacy_batch_size", 256)
+        self.spacy_n_process = config.get("spacy_n_process", 1)
+        self.data_dir = data_dir
+        self.index_dir = config.get("retrieval_index_dir")
+        if self.index_dir:
+            # relative to the config file, like data_dir
+            self.index_dir = os.path.join(os.path.dirname(data_dir), self.index_dir)
+        self.files = {
+            normalize_goal(goal): (goal, os.path.join(data_dir, filename))
+            for goal, filename in config.get("domain_files", {}).items()
+            if normalize_goal(goal) in retrieval_goals
+        }
+        self.partitions = {}
+        # goal name -> LoadStats of the last read of its domain file
+        self.load_stats = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        reload_cfg = config.get("retrieval_reload", {})
+        # refit vocabulary/IDF once appended rows exceed this share of a goal,
+        # or on the watcher's schedule when any are pending
+        self.refit_fraction = reload_cfg.get("refit_fraction", 0.2)
+        self.refit_interval = reload_cfg.get("refit_interval", 3600)
+        # served rows per session_id, so repeat quizzes skip seen questions
+        self.sessions = sessions.open_store(
+            config.get("sessions", {}), processes=config.get("inference", {}).get("executor") == "process"
+        )
 
-            path = os.path.join(data_dir, filename)
-            if not os.path.isfile(path):
-                logger.warning(f"Missing file for goal '{goal}': {path}")
-                continue
+        # goals left out of retrieval_preload_goals are loaded on first request
+        preload = config.get("retrieval_preload_goals")
+        preload = list(self.files) if preload is None else [normalize_goal(g) for g in preload]
+        for key in preload:
+            self.load_goal(key)
+
+        if preload and not self.partitions:
+            raise RuntimeError("No questions loaded. Check domain_files & data directory.")
+
+    def load_goal(self, goal):
+        key = normalize_goal(goal)
+        if key not in self.files:
+            raise ValueError(f"No domain file configured for goal: {goal}")
+        name, path = self.files[key]
+        if not os.path.isfile(path):
+            self.logger.warning(f"Missing file for goal '{name}': {path}")
+            return None
 
+        # serialised with reload_goal, so a lazy first load never replaces a
+        # partition a concurrent reload has just swapped in
+        with self._reload_lock:
+            if key in self.partitions:
+                return self.partitions[key]
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    questions = json.load(f)
-                self.bank.extend(questions)
-                logger.info(f"Loaded {len(questions)} questions for '{goal}'")
+                mtime = os.stat(path).st_mtime_ns
+                with metrics.stage("load_partition"):
+                    partition = self._open(name, path)
             except Exception as e:
-                logger.error(f"Failed to load {path}: {e}")
+                self.logger.error(f"Failed to load {path}: {e}")
+                return None
 
-        if not self.bank:
-            raise RuntimeError("No questions loaded. Check domain_files & data directory.")
+            partition.source_mtime = mtime
+            self.partitions[key] = partition
+        self.logger.info(f"Loaded {len(partition)} questions for '{name}'")
+        return partition
 
-        texts = [
-            (q.get("context", "") + " " + q.get("question", "")).strip()
-            for q in self.bank
-        ]
-        self.vectorizer = TfidfVectorizer(stop_words="english")
-        self.matrix = self.vectorizer.fit_transform(texts)
-
-        self.meta = [
-            {
-                "topic": q.get("topic", "").lower(),
-                "goal": q.get("goal", "").lower(),
-                "type": q.get("type", ""),
-                "difficulty": q.get("difficulty", "")
-            }
-            for q in self.bank
-        ]
-
-    def match(self, topics, goal, max_q=5, difficulty=None, q_types=None):
-        query = " ".join(topics)
-        vec = self.vectorizer.transform([query])
-        scores = cosine_similarity(vec, self.matrix).flatten()
-
-        for i, m in enumerate(self.meta):
-            if any(t in m["topic"] or m["topic"] in t for t in topics):
-                scores[i] += 0.2
-
-        top_k_idxs = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:50]
-        random.shuffle(top_k_idxs)
+    def _update(self, old, records):
+        return old.updated(records, self.extractor, self.spacy_batch_size, self.spacy_n_process)
 
-        selected = []
-        for i in top_k_idxs:
-            md = self.meta[i]
-            if md["goal"].lower() != goal.lower():
-                continue
-            if difficulty and md["difficulty"].lower() != difficulty.lower():
-                continue
-            if q_types and md["type"].lower() not in [t.lower() for t in q_types]:
-                continue
+    def reload_goal(self, goal, refit=False):
+        """Pick up edits to a goal's domain file while requests keep running.
 
-            q = dict(self.bank[i])
-            q["score"] = float(scores[i])
-            selected.append(q)
-            if len(selected) >= max_q:
-                return selected
+        The replacement partition is built off to the side and swapped in
+        with one dict assignment, so a request sees either the old index or
+        the new one, never a mix. Returns a summary of what changed.
+        """
+        key = normalize_goal(goal)
+        if key not in self.files:
+            raise ValueError(f"No domain file configured for goal: {goal}")
+        name, path = self.files[key]
+        with self._reload_lock:
+            old = self.partitions.get(key)
+            mtime = os.stat(path).st_mtime_ns
+            if old is not None and not refit and old.source_mtime == mtime:
+                return {"goal": name, "rows": len(old), "added": 0, "removed": 0, "refit": False, "skipped": 0}
+
+            start = time.perf_counter()
+            added = removed = 0
+            if old is not None:
+                with metrics.stage("ingest"):
+                    partition, order, new_rows = self._update(old, self._read(name, path))
+                added = len(new_rows)
+                removed = len(old) - (len(order) - added)
+                refit = refit or partition.pending > self.refit_fraction * max(1, len(partition))
+            if old is None or refit:
+                with metrics.stage("refit"):
+                    partition = self._open(name, path)
+                if old is None:
+                    added = len(partition)
+            partition.source_mtime = mtime
+            self.partitions[key] = partition
+
+        self.logger.info(
+            f"Reloaded '{name}': +{added} -{removed} rows, {len(partition)} total"
+            f"{' (refit)' if refit else ''} in {time.perf_counter() - start:.3f}s"
+        )
+        stats = self.load_stats.get(name)
+        return {"goal": name, "rows": len(partition), "added": added, "removed": removed, "refit": bool(refit),
+                "skipped": stats.skipped if stats else 0}
+
+    def reload(self, refit=False):
+        """reload_goal() for every loaded goal whose file changed."""
+        return [self.reload_goal(key, refit) for key in list(self.partitions)]
+
+    def watch(self, interval=5.0):
+        """Poll domain files in a daemon thread and reload changed goals.
+
+        Goals with appended-but-unfitted rows are also refit once
+        `refit_interval` seconds have passed since their last full fit.
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                for key, part in list(self.partitions.items()):
+                    try:
+                        due = part.pending and time.time() - part.fitted_at > self.refit_interval
+                        self.reload_goal(key, refit=bool(due))
+                    except Exception as e:
+                        self.logger.error(f"Reload of '{key}' failed: {e}")
+
+        thread = threading.Thread(target=loop, name="bank-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def _open(self, name, path):
+        if not self.index_dir:
+            return self._with_topics(GoalPartition(name, self._read(name, path)))
+
+        # reuse the persisted index unless the domain file's content changed
+        digest = index_store.file_hash(path)
+        saved = index_store.partition_dir(self.index_dir, name, digest)
+        if not os.path.isdir(saved):
+            partition = self._with_topics(GoalPartition(name, self._read(name, path)))
+            os.makedirs(self.index_dir, exist_ok=True)
+            saved = index_store.save_partition(self.index_dir, partition, digest)
+            self.logger.info(f"Built retrieval index for '{name}' at {saved}")
+        _, records, vectorizer, matrix, columns, topics = index_store.load_partition(saved)
+        partition = self._with_topics(GoalPartition(name, records, vectorizer, matrix, columns, topics))
+        partition.source_dir = saved
+        return partition
+
+    def _read(self, name, path):
+        # malformed rows are skipped and counted instead of failing the goal
+        records, stats = load_records(path, RETRIEVAL_SCHEMA)
+        self.load_stats[name] = stats
+        return records
+
+    def _with_topics(self, partition):
+        if partition.topics is None and self.extractor is not None:
+            texts = [_text(q) for q in partition.bank]
+            partition.topics = self.extractor.extract_many(texts, self.spacy_batch_size, self.spacy_n_process)
+        return partition
 
-        logger.warning(f"[{goal}] Only {len(selected)} questions matched. Using fallback.")
+    def unload_goal(self, goal):
+        return self.partitions.pop(normalize_goal(goal), None) is not None
 
-        additional = [
-            q for i, q in enumerate(self.bank)
-            if q.get("goal", "").lower() == goal.lower()
-            and q.get("difficulty", "").lower() == difficulty.lower()
-            and (not q_types or q.get("type", "").lower() in [t.lower() for t in q_types])
-            and q not in selected
-        ]
-        random.shuffle(additional)
-        selected.extend(additional[: max_q - len(selected)])
+    def partition(self, goal):
+        key = normalize_goal(goal)
+        part = self.partitions.get(key)
+        if part is None and key in self.files:
+            with self._lock:
+                part = self.partitions.get(key)
+                if part is None:
+                    part = self.load_goal(key)
+        return part
 
+    @property
+    def bank(self):
+        return [q for p in self.partitions.values() for q in p.bank]
+
+    def score(self, part, rows, topic_lists):
+        """Relevance of `rows` for each topic list, shape (len(rows), len(topic_lists))."""
+        return part.score_many(rows, topic_lists)
+
+    @staticmethod
+    def _top(idx, scores, n, rng=random):
+        """Up to `n` of `idx`, drawn at random from its 50 best scores."""
+        k = min(50, len(idx))
+        top = idx[np.argpartition(-scores[idx], k - 1)[:k]] if k < len(idx) else idx
+        top = list(top)
+        rng.shuffle(top)
+        return top[:n]
+
+    def _pick(self, part, rows, scores, goal, max_q, session_id=None, rng=random):
+        def pick(served):
+            fresh = ~sessions.contains(served, rows)
+            chosen = self._top(np.flatnonzero(fresh), scores, max_q, rng)
+            wrapped = len(chosen) < max_q and len(chosen) < len(rows)
+            if wrapped:
+                # everything else was served already: top up and start a new cycle
+                chosen += self._top(np.flatnonzero(~fresh), scores, max_q - len(chosen), rng)
+            return chosen, [rows[j] for j in chosen], wrapped
+
+        if session_id and self.sessions is not None:
+            scope = f"retrieval:{normalize_goal(part.goal)}"
+            chosen = self.sessions.draw(session_id, scope, part.source_mtime, pick)
+        else:
+            chosen = self._top(np.arange(len(rows)), scores, max_q, rng)
+
+        selected = []
+        for j in chosen:
+            q = dict(part.bank[rows[j]])
+            q["score"] = float(scores[j])
+            selected.append(q)
+
+        if len(selected) < max_q:
+            self.logger.warning(f"[{goal}] Only {len(selected)} questions matched.")
         return selected
+
+    def match(self, topics, goal, max_q=5, difficulty=None, q_types=None, session_id=None, rng=random):
+        part = self.partition(goal)
+        with metrics.stage("filter"):
+            rows = part.candidates(difficulty, q_types) if part is not None else []
+        if len(rows) == 0:
+            self.logger.warning(f"[{goal}] No questions match the requested filters.")
+            return []
+
+        with metrics.stage("score"):
+            scores = self.score(part, rows, [topics])[:, 0]
+        return self._pick(part, rows, scores, goal, max_q, session_id, rng)
+
+    def match_many(self, goal, queries):
+        """Run several match() calls for one goal with a single scoring pass.
+
+        `queries` holds (topics, max_q, difficulty, q_types, session_id, rng) tuples.
+        """
+        part = self.partition(goal)
+        if part is None:
+            self.logger.warning(f"[{goal}] No questions match the requested filters.")
+            return [[] for _ in queries]
+
+        with metrics.stage("filter"):
+            rows_per = [part.candidates(difficulty, q_types) for _, _, difficulty, q_types, _, _ in queries]
+            union = np.unique(np.concatenate(rows_per)) if rows_per else np.zeros(0, dtype=np.int64)
+        with metrics.stage("score"):
+            scores = self.score(part, union, [topics for topics, *_ in queries]) if len(union) else None
+
+        results = []
+        for j, (rows, (_, max_q, _, _, session_id, rng)) in enumerate(zip(rows_per, queries)):
+            if len(rows) == 0:
+                self.logger.warning(f"[{goal}] No questions match the requested filters.")
+                results.append([])
+                continue
+            results.append(self._pick(part, rows, scores[np.searchsorted(union, rows), j], goal, max_q, session_id, rng))
+        return results
@@ -1,35 +1,91 @@
 from app.retrieval_quiz.topic_extractor import TopicExtractor
 from app.retrieval_quiz.question_matcher import QuestionMatcher
+from app.retrieval_quiz.dense_matcher import DenseMatcher
 import random
 import logging
 
+from app import metrics
+from app.normalize import normalize_goal
+
 logger = logging.getLogger(__name__)
 
+Q_TYPES = ["mcq", "short_answer"]
+
 class QuizGenerator:
     def __init__(self, config, data_dir, retrieval_goals, logger):
-        self.matcher = QuestionMatcher(config, data_dir, retrieval_goals, logger)
         self.extractor = TopicExtractor(config.get("spacy_model", "en_core_web_sm"))
+        matcher_cls = DenseMatcher if config.get("retrieval_backend", "tfidf") == "hybrid" else QuestionMatcher
+        self.matcher = matcher_cls(config, data_dir, retrieval_goals, logger, extractor=self.extractor)
+        metrics.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        info = self.extractor.cache_info()
+        yield "quiz_topic_cache_hits_total", "counter", "spaCy topic cache hits.", {}, info.hits
+        yield "quiz_topic_cache_misses_total", "counter", "spaCy topic cache misses.", {}, info.misses
+        yield "quiz_retrieval_partitions_loaded", "gauge", "Goal partitions resident in memory.", {}, len(self.matcher.partitions)
+        if self.matcher.sessions is not None:
+            yield "quiz_sessions", "gauge", "Sessions with served-question history.", {}, len(self.matcher.sessions)
+        for goal, stats in list(self.matcher.load_stats.items()):
+            yield "quiz_records_skipped", "gauge", "Rows rejected by the last load of a bank file.", {"source": goal}, stats.skipped
 
-    def retrieve_quiz(self, goal, difficulty, num_questions):
-        goal_questions = [
-            q for q in self.matcher.bank
-            if q.get("goal", "").lower() == goal.lower()
-        ]
+    @metrics.traced("seed_topics")
+    def seed_topics(self, goal, difficulty=None, q_types=None, rng=random):
+        part = self.matcher.partition(goal)
+        goal_questions = part.bank if part is not None else []
 
         if not goal_questions:
             logger.warning(f"No questions found for goal: {goal}")
-            return []
+            return None
 
-        seed = random.choice(goal_questions)
-        seed_text = f"{seed.get('context', '')} {seed.get('question', '')}".strip()
-        topics = self.extractor.extract(seed_text) or [goal.lower()]
+        # seed from the requested slice; fall back to any row of the goal
+        i = part.sample(difficulty, q_types, rng)
+        if i is None:
+            i = rng.randrange(len(goal_questions))
+        if part.topics is not None:
+            topics = list(part.topics[i]) or [goal.lower()]
+        else:
+            seed = goal_questions[i]
+            seed_text = f"{seed.get('context', '')} {seed.get('question', '')}".strip()
+            topics = self.extractor.extract(seed_text) or [goal.lower()]
 
         logger.info(f"[{goal}] Extracted topics: {topics}")
+        return topics
+
+    def retrieve_quiz(self, goal, difficulty, num_questions, session_id=None, seed=None):
+        rng = random.Random(seed) if seed is not None else random
+        topics = self.seed_topics(goal, difficulty, Q_TYPES, rng)
+        if topics is None:
+            return []
 
         return self.matcher.match(
             topics=topics,
             goal=goal,
             max_q=num_questions,
             difficulty=difficulty,
-            q_types=["mcq", "short_answer"]
-        )
\ No newline at end of file
+            q_types=Q_TYPES,
+            session_id=session_id,
+            rng=rng
+        )
+
+    def iter_retrieve_batch(self, specs):
+        """Yield (index, questions) per spec, scoring each goal's quizzes together."""
+        by_goal = {}
+        for idx, (goal, difficulty, num_questions, session_id, seed) in enumerate(specs):
+            rng = random.Random(seed) if seed is not None else random
+            by_goal.setdefault(normalize_goal(goal), []).append((idx, goal, difficulty, num_questions, session_id, rng))
+
+        for group in by_goal.values():
+            goal = group[0][1]
+            # one seed per quiz, as retrieve_quiz does
+            seeds = [self.seed_topics(goal, difficulty, Q_TYPES, rng) for _, _, difficulty, _, _, rng in group]
+            if seeds[0] is None:
+                for idx, *_ in group:
+                    yield idx, []
+                continue
+
+            queries = [
+                (topics, num_questions, difficulty, Q_TYPES, session_id, rng)
+                for topics, (_, _, difficulty, num_questions, session_id, rng) in zip(seeds, group)
+            ]
+            for (idx, *_), result in zip(group, self.matcher.match_many(goal, queries)):
+                yield idx, result
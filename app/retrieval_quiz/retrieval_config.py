@@ -2,6 +2,8 @@ import os
 import json
 import logging
 
+from app.normalize import normalize_goal
+
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Check multiple candidate locations
@@ -23,7 +25,7 @@ with open(CONFIG_PATH, "r", encoding="utf-8") as f:
 
 # Load constants
 DATA_DIR = os.path.join(os.path.dirname(CONFIG_PATH), "data")
-RETRIEVAL_GOALS = {g.lower() for g in CONFIG.get("retrieval_supported_goals", [])}
+RETRIEVAL_GOALS = {normalize_goal(g) for g in CONFIG.get("retrieval_supported_goals", [])}
 
 # Logging setup
 logging.basicConfig(level=logging.INFO)
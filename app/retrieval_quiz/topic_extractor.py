@@ -1,19 +1,41 @@
 import spacy
+from functools import lru_cache
+
+from app import metrics
 
 class TopicExtractor:
-    def __init__(self, spacy_model: str):
+    def __init__(self, spacy_model: str, exclude=("senter", "textcat", "textcat_multilabel"), cache_size: int = 4096):
         self.nlp = spacy.load(spacy_model)
+        # drop pipes whose output extract() never reads
+        for name in exclude:
+            if name in self.nlp.pipe_names:
+                self.nlp.remove_pipe(name)
+        self.use_lemmas = "lemmatizer" in self.nlp.pipe_names
         self.keep_labels = {
             "ORG", "PRODUCT", "GPE", "LOC", "PERSON",
             "WORK_OF_ART", "EVENT", "NORP", "FAC"
         }
+        self._cached = lru_cache(maxsize=cache_size)(self._extract_tuple)
 
-    def extract(self, text: str):
-        doc = self.nlp(text)
+    def topics(self, doc):
         ents = [ent.text for ent in doc.ents if ent.label_ in self.keep_labels]
         chunks = [c.text for c in doc.noun_chunks if len(c.text.split()) <= 3]
         kws = [
-            tok.lemma_ for tok in doc
+            tok.lemma_ if self.use_lemmas else tok.lower_ for tok in doc
             if tok.pos_ in {"NOUN", "PROPN", "ADJ"} and not tok.is_stop and len(tok.text) > 2
         ]
-        return list(set(ents + chunks + kws))
\ No newline at end of file
+        return list(set(ents + chunks + kws))
+
+    def _extract_tuple(self, text: str):
+        with metrics.stage("spacy"):
+            return tuple(self.topics(self.nlp(text)))
+
+    def extract(self, text: str):
+        return list(self._cached(text))
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+    @metrics.traced("spacy_batch")
+    def extract_many(self, texts, batch_size: int = 256, n_process: int = 1):
+        return [self.topics(doc) for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
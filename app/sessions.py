@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Per-session record of which rows a learner has already been served, so
+# repeated quizzes draw fresh questions. Each (session, scope) pair holds a
+# bitset over the row ids of one pool (a goal's partition, or a goal and
+# difficulty slice of Model.json) together with the pool's version; a new
+# version (the file was reloaded and rows renumbered) starts a fresh bitset.
+
+logger = logging.getLogger("sessions")
+
+# draw() callback: served bits -> (result, rows to mark, reset before marking)
+Pick = Callable[[Optional[bytes]], Tuple[Any, Iterable[int], bool]]
+
+
+def has(bits: Optional[bytes], i: int) -> bool:
+    return bits is not None and (i >> 3) < len(bits) and bool(bits[i >> 3] & (1 << (i & 7)))
+
+
+def contains(bits: Optional[bytes], rows: np.ndarray) -> np.ndarray:
+    """Boolean mask over `rows`: True where the row is set in `bits`."""
+    rows = np.asarray(rows, dtype=np.int64)
+    if not bits:
+        return np.zeros(len(rows), dtype=bool)
+    arr = np.frombuffer(bits, dtype=np.uint8)
+    byte = rows >> 3
+    inside = byte < len(arr)
+    out = np.zeros(len(rows), dtype=bool)
+    out[inside] = (arr[byte[inside]] >> (rows[inside] & 7).astype(np.uint8)) & 1 == 1
+    return out
+
+
+def _set(bits: bytearray, rows: Iterable[int]) -> bytearray:
+    for i in rows:
+        i = int(i)
+        if (i >> 3) >= len(bits):
+            bits.extend(bytes((i >> 3) + 1 - len(bits)))
+        bits[i >> 3] |= 1 << (i & 7)
+    return bits
+
+
+def _clear(bits: bytearray, rows: Iterable[int]) -> bytearray:
+    for i in rows:
+        i = int(i)
+        if (i >> 3) < len(bits):
+            bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+    return bits
+
+
+def sample_unserved(n: int, k: int, served: Optional[bytes], rng=None) -> Tuple[List[int], bool]:
+    """`k` distinct ids from range(n), unserved ones first.
+
+    Rejection sampling keeps this O(k) while most of the pool is unserved;
+    it falls back to a scan once misses pile up. Returns (ids, wrapped)
+    where `wrapped` means the unserved ids ran out and served ones were
+    reused, i.e. the session should start a new cycle.
+    """
+    rng = rng or random
+    k = min(k, n)
+    picked: List[int] = []
+    seen = set()
+    tries = 0
+    while len(picked) < k and tries < 4 * k + 16:
+        tries += 1
+        i = rng.randrange(n)
+        if i in seen or has(served, i):
+            continue
+        seen.add(i)
+        picked.append(i)
+    if len(picked) < k:
+        rest = [i for i in range(n) if i not in seen and not has(served, i)]
+        fill = rng.sample(rest, min(k - len(picked), len(rest)))
+        picked += fill
+        seen.update(fill)
+    wrapped = len(picked) < k
+    if wrapped:
+        rest = [i for i in range(n) if i not in seen]
+        picked += rng.sample(rest, k - len(picked))
+    return picked, wrapped
+
+
+class SessionStore:
+    """In-process bitsets of served rows, bounded by TTL and LRU.
+
+    A session idle for `ttl` seconds is forgotten, and at most
+    `max_sessions` sessions are kept (least recently used go first).
+    """
+
+    def __init__(self, ttl: float = 86400, max_sessions: int = 10000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # session -> (last_seen, {scope: (version, bits)})
+        self._sessions: "OrderedDict[str, Tuple[float, Dict[str, Tuple[Any, bytearray]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float) -> None:
+        # ordered by last use, so expired sessions sit at the front
+        while self._sessions:
+            seen = next(iter(self._sessions.values()))[0]
+            if now - seen <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def _read(self, session_id: str, scope: str, version: Any, now: float) -> Optional[bytes]:
+        entry = self._sessions.get(session_id)
+        if entry is None or now - entry[0] > self.ttl:
+            return None
+        stored = entry[1].get(scope)
+        if stored is None or stored[0] != version:
+            return None
+        return bytes(stored[1])
+
+    def served(self, session_id: str, scope: str, version: Any) -> Optional[bytes]:
+        with self._lock:
+            return self._read(session_id, scope, version, time.time())
+
+    def mark(self, session_id: str, scope: str, version: Any, rows: Iterable[int], reset: bool = False) -> None:
+        """Add `rows` to the session's bitset; `reset` clears it first."""
+        self.draw(session_id, scope, version, lambda bits: (None, rows, reset))
+
+    def draw(self, session_id: str, scope: str, version: Any, pick: Pick) -> Any:
+        """Read the served bits, `pick` from them and mark the picked rows as
+        one step, so concurrent requests of a session never pick the same rows."""
+        with self._lock:
+            now = time.time()
+            result, rows, reset = pick(self._read(session_id, scope, version, now))
+            entry = self._sessions.pop(session_id, None)
+            scopes = entry[1] if entry is not None and now - entry[0] <= self.ttl else {}
+            stored = scopes.get(scope)
+            bits = stored[1] if stored is not None and stored[0] == version and not reset else bytearray()
+            scopes[scope] = (version, _set(bits, rows))
+            self._sessions[session_id] = (now, scopes)
+            self._expire(now)
+        return result
+
+    def release(self, session_id: str, scope: str, version: Any, rows: Iterable[int]) -> None:
+        """Unmark `rows` that were drawn but never delivered."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            stored = entry[1].get(scope) if entry is not None else None
+            if stored is not None and stored[0] == version:
+                _clear(stored[1], rows)
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """SessionStore persisted to a local SQLite file.
+
+    Survives restarts and is shared by every worker process on the host.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, max_sessions: int = 10000, purge_every: int = 256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT, scope TEXT, version TEXT, bits BLOB, seen REAL, "
+            "PRIMARY KEY (session_id, scope))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_seen ON sessions (seen)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(DISTINCT session_id) FROM sessions").fetchone()[0]
+
+    def _read(self, session_id: str, scope: str, version: Any, now: float) -> Optional[bytes]:
+        row = self._db.execute(
+            "SELECT version, bits FROM sessions WHERE session_id = ? AND scope = ? AND seen >= ?",
+            (session_id, scope, now - self.ttl),
+        ).fetchone()
+        if row is None or row[0] != str(version):
+            return None
+        return bytes(row[1])
+
+    def served(self, session_id: str, scope: str, version: Any) -> Optional[bytes]:
+        with self._lock:
+            return self._read(session_id, scope, version, time.time())
+
+    def mark(self, session_id: str, scope: str, version: Any, rows: Iterable[int], reset: bool = False) -> None:
+        self.draw(session_id, scope, version, lambda bits: (None, rows, reset))
+
+    def draw(self, session_id: str, scope: str, version: Any, pick: Pick) -> Any:
+        # one IMMEDIATE transaction holds the write lock across read, pick
+        # and mark, so other worker processes wait rather than pick the same rows
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                served = self._read(session_id, scope, version, now)
+                result, rows, reset = pick(served)
+                bits = bytearray(served) if served is not None and not reset else bytearray()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, scope, version, bits, seen) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, scope, str(version), bytes(_set(bits, rows)), now),
+                )
+                # one session's scopes share its last-seen time
+                self._db.execute("UPDATE sessions SET seen = ? WHERE session_id = ?", (now, session_id))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._purge(now)
+        return result
+
+    def release(self, session_id: str, scope: str, version: Any, rows: Iterable[int]) -> None:
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                served = self._read(session_id, scope, version, now)
+                if served is not None:
+                    self._db.execute(
+                        "UPDATE sessions SET bits = ? WHERE session_id = ? AND scope = ?",
+                        (bytes(_clear(bytearray(served), rows)), session_id, scope),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _purge(self, now: float) -> None:
+        self._db.execute("DELETE FROM sessions WHERE seen < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions GROUP BY session_id "
+            "ORDER BY MAX(seen) DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,),
+        )
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+def open_store(cfg: Dict[str, Any], processes: bool = False):
+    """Session store described by the "sessions" config block, or None if disabled.
+
+    `processes` means requests are served by several processes (a process
+    executor); the in-memory backend cannot be shared there, so SQLite is
+    used instead.
+    """
+    if not cfg.get("enabled", True):
+        return None
+    ttl, max_sessions = cfg.get("ttl", 86400), cfg.get("max_sessions", 10000)
+    backend = cfg.get("backend", "memory")
+    if backend == "memory" and processes:
+        logger.warning("sessions backend 'memory' is per process; using 'sqlite' for the process executor")
+        backend = "sqlite"
+    if backend == "sqlite":
+        return SQLiteSessionStore(cfg.get("path", "./cache/sessions.sqlite"), ttl, max_sessions)
+    return SessionStore(ttl, max_sessions)
@@ -0,0 +1,78 @@
+"""Throughput of incremental bank ingestion vs a full refit.
+
+Copies one goal's domain file to a scratch directory, then repeatedly
+appends synthetic questions and times QuestionMatcher.reload_goal (rows
+transformed with the fitted vocabulary) against a forced full refit.
+
+    python -m benchmarks.bench_ingest --goal "Cyber Security" --batches 10 50 200
+    python -m benchmarks.bench_ingest --with-topics   # include spaCy on added rows
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from app.retrieval_quiz.retrieval_config import CONFIG, DATA_DIR, logger
+from app.retrieval_quiz.question_matcher import QuestionMatcher
+from app.normalize import normalize_goal
+
+
+def synthetic(bank, n, start):
+    return [
+        dict(q, question=f"{q.get('question', '')} (variant {start + i})")
+        for i, q in enumerate(bank[(start + j) % len(bank)] for j in range(n))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental ingest benchmark.")
+    parser.add_argument("--goal", default="Cyber Security")
+    parser.add_argument("--batches", type=int, nargs="*", default=[10, 50, 200, 1000])
+    parser.add_argument("--with-topics", action="store_true")
+    args = parser.parse_args()
+
+    filename = CONFIG["domain_files"][args.goal]
+    scratch = tempfile.mkdtemp(prefix="ingest-")
+    path = os.path.join(scratch, filename)
+    shutil.copy(os.path.join(DATA_DIR, filename), path)
+
+    extractor = None
+    if args.with_topics:
+        from app.retrieval_quiz.topic_extractor import TopicExtractor
+        extractor = TopicExtractor(CONFIG.get("spacy_model", "en_core_web_sm"))
+
+    config = dict(CONFIG, domain_files={args.goal: filename}, retrieval_index_dir=None, retrieval_preload_goals=[args.goal])
+    matcher = QuestionMatcher(config, scratch, {normalize_goal(args.goal)}, logger, extractor=extractor)
+    # never refit on the incremental path; refits are timed separately
+    matcher.refit_fraction = float("inf")
+
+    with open(path, "r", encoding="utf-8") as f:
+        bank = json.load(f)
+
+    print(f"{args.goal}: {len(bank)} rows")
+    print(f"{'added':>7} {'rows':>7} {'incremental s':>14} {'rows/s':>10} {'refit s':>9} {'speedup':>8}")
+    try:
+        for n in args.batches:
+            bank += synthetic(bank, n, len(bank))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(bank, f)
+
+            start = time.perf_counter()
+            summary = matcher.reload_goal(args.goal)
+            incremental = time.perf_counter() - start
+
+            start = time.perf_counter()
+            matcher.reload_goal(args.goal, refit=True)
+            refit = time.perf_counter() - start
+
+            print(f"{summary['added']:7d} {summary['rows']:7d} {incremental:14.4f} {summary['added'] / incremental:10.0f} "
+                  f"{refit:9.4f} {refit / incremental:7.1f}x")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Load and latency benchmark for both generator modes.
+
+Drives POST /generate through the ASGI app in-process (no server, no
+network) and/or calls the generators directly, over a grid of concurrency
+levels and num_questions, cycling through the mode's goals. Reports
+throughput, p50/p95/p99 latency, per-stage timings and peak RSS as JSON.
+
+    python -m benchmarks.bench_load --mode retrieval --concurrency 1 8 --num-questions 5 10
+    python -m benchmarks.bench_load --mode model --stub-models --save-baseline cache/bench_model.json
+    python -m benchmarks.bench_load --mode model --stub-models --baseline cache/bench_model.json
+
+The ASGI target serves whatever `generator_mode` config.json selects, so
+it only runs when that matches --mode. --stub-models swaps the transformer
+calls (model mode) or the spaCy extractor (retrieval mode) for cheap
+deterministic stand-ins, so the suite runs in CI without the weights; it
+then measures everything around the models.
+"""
+
+import sys
+import json
+import time
+import logging
+import random
+import asyncio
+import resource
+import argparse
+import functools
+import statistics
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from app.retrieval_quiz.retrieval_config import CONFIG
+
+STAGES = {
+    "model": ("plan_quiz", "generate_questions", "correct_grammar", "extract_answers_with_qa", "get_distractors", "build_quizzes"),
+    "retrieval": ("seed_topics", "match"),
+}
+
+stage_times = defaultdict(list)
+
+
+def _timed_stage(name, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stage_times[name].append(time.perf_counter() - start)
+    return wrapper
+
+
+class _StubEmbeddings:
+    def sync(self, items, version=None):
+        pass
+
+    def rank(self, answers, pools, top_k=3):
+        return [list(pool)[:top_k] for pool in pools]
+
+
+class _StubExtractor:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def extract(self, text):
+        return [w.lower() for w in text.split() if w.isalpha() and len(w) > 3][:5]
+
+    def extract_many(self, texts, batch_size=None, n_process=None):
+        return [self.extract(t) for t in texts]
+
+    def cache_info(self):
+        return functools._CacheInfo(0, 0, None, 0)
+
+
+def setup_model(stub, no_cache):
+    from app.model_quiz import quiz_model
+    from app.model_quiz.cache_model import GenerationCache
+
+    if stub:
+        quiz_model.t5_generate = lambda prompts: [f"What does this describe: {p[-48:].strip()}?" for p in prompts]
+        quiz_model.grammar_generate = lambda inputs: [x[len("gec: "):] for x in inputs]
+        quiz_model.qa_engines = lambda: []
+        quiz_model.embedding_store = lambda: _StubEmbeddings()
+    if no_cache:
+        quiz_model.gen_cache = GenerationCache(quiz_model.gen_cache.namespace, max_size=0)
+    for name in STAGES["model"]:
+        setattr(quiz_model, name, _timed_stage(name, getattr(quiz_model, name)))
+    return quiz_model.run_model_quiz, sorted(quiz_model.SUPPORTED_GOALS)
+
+
+def setup_retrieval(stub):
+    from app.retrieval_quiz import quiz_retrieval
+    from app.retrieval_quiz.entrypoint import get_generator
+
+    if stub:
+        quiz_retrieval.TopicExtractor = _StubExtractor
+    generator = get_generator()
+    generator.seed_topics = _timed_stage("seed_topics", generator.seed_topics)
+    generator.matcher.match = _timed_stage("match", generator.matcher.match)
+    return generator.retrieve_quiz, list(CONFIG["retrieval_supported_goals"])
+
+
+def percentiles(times):
+    times = sorted(times)
+
+    def pct(p):
+        return times[min(len(times) - 1, int(len(times) * p))] * 1000
+
+    return {"p50_ms": round(pct(0.50), 2), "p95_ms": round(pct(0.95), 2), "p99_ms": round(pct(0.99), 2)}
+
+
+def run_direct(fn, specs, concurrency):
+    def one(spec):
+        start = time.perf_counter()
+        try:
+            fn(*spec)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(one, specs))
+
+
+def run_asgi(specs, concurrency):
+    import httpx
+    from app.main import app
+
+    async def main():
+        sem = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(spec):
+                goal, difficulty, n = spec
+                async with sem:
+                    start = time.perf_counter()
+                    r = await client.post("/generate", json={"goal": goal, "difficulty": difficulty, "num_questions": n})
+                    elapsed = time.perf_counter() - start
+                return elapsed, None if r.status_code == 200 else f"HTTP {r.status_code}"
+            return await asyncio.gather(*(one(s) for s in specs))
+
+    return asyncio.run(main())
+
+
+def compare(report, baseline, tolerance):
+    base = {(r["target"], r["concurrency"], r["num_questions"]): r for r in baseline["results"]}
+    failures = []
+    for r in report["results"]:
+        b = base.get((r["target"], r["concurrency"], r["num_questions"]))
+        if b is None:
+            continue
+        cell = f"{r['target']} c={r['concurrency']} n={r['num_questions']}"
+        if r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            failures.append(f"{cell}: p95 {r['p95_ms']:.1f} ms vs baseline {b['p95_ms']:.1f} ms")
+        if r["throughput_rps"] < b["throughput_rps"] * (1 - tolerance):
+            failures.append(f"{cell}: throughput {r['throughput_rps']:.1f}/s vs baseline {b['throughput_rps']:.1f}/s")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz generation load benchmark.")
+    parser.add_argument("--mode", choices=("model", "retrieval"), default=CONFIG.get("generator_mode", "model"))
+    parser.add_argument("--target", choices=("asgi", "direct", "both"), default="both")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 4, 16])
+    parser.add_argument("--num-questions", type=int, nargs="*", default=[1, 5, 10])
+    parser.add_argument("--goals", nargs="*")
+    parser.add_argument("--difficulty", default="beginner")
+    parser.add_argument("--requests", type=int, default=32, help="requests per grid cell")
+    parser.add_argument("--stub-models", action="store_true")
+    parser.add_argument("--no-cache", action="store_true", help="model mode: bypass the generation cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # per-request INFO logs would dominate the measured time
+    logging.disable(logging.INFO)
+    random.seed(args.seed)
+    if args.mode == "model":
+        fn, goals = setup_model(args.stub_models, args.no_cache)
+    else:
+        fn, goals = setup_retrieval(args.stub_models)
+    goals = args.goals or goals
+
+    targets = ["asgi", "direct"] if args.target == "both" else [args.target]
+    if "asgi" in targets and CONFIG.get("generator_mode") != args.mode:
+        print(f"skipping asgi: config.json serves {CONFIG.get('generator_mode')!r}, not {args.mode!r}", file=sys.stderr)
+        targets.remove("asgi")
+
+    results = []
+    for target in targets:
+        for concurrency in args.concurrency:
+            for n in args.num_questions:
+                specs = [(goals[i % len(goals)], args.difficulty, n) for i in range(args.requests)]
+                # one untimed request per cell so lazy loading is not measured
+                run_direct(fn, specs[:1], 1) if target == "direct" else run_asgi(specs[:1], 1)
+                start = time.perf_counter()
+                outcomes = run_direct(fn, specs, concurrency) if target == "direct" else run_asgi(specs, concurrency)
+                wall = time.perf_counter() - start
+                times = [t for t, err in outcomes if err is None]
+                results.append({
+                    "target": target,
+                    "concurrency": concurrency,
+                    "num_questions": n,
+                    "requests": len(specs),
+                    "errors": sum(err is not None for _, err in outcomes),
+                    "throughput_rps": round(len(times) / wall, 2),
+                    **(percentiles(times) if times else {"p50_ms": None, "p95_ms": None, "p99_ms": None}),
+                })
+
+    report = {
+        "mode": args.mode,
+        "stub_models": args.stub_models,
+        "results": results,
+        "stages": {
+            name: {"count": len(times), "mean_ms": round(statistics.mean(times) * 1000, 3), **percentiles(times)}
+            for name, times in stage_times.items() if times
+        },
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failures = compare(report, json.load(f), args.tolerance)
+        for line in failures:
+            print("REGRESSION:", line, file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
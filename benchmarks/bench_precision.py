@@ -0,0 +1,101 @@
+"""Accuracy vs latency of each model at fp32, int8 and ONNX precision.
+
+A fixed, seeded sample of Model.json items is run through every model at
+every precision. fp32 is the reference: for the generators and QA models
+agreement is the share of outputs identical to fp32, for SBERT it is the
+mean cosine between fp32 and candidate embeddings.
+
+    python -m benchmarks.bench_precision --items 64 --batch-size 16
+    python -m benchmarks.bench_precision --models qa sbert --precisions fp32 int8
+"""
+
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+
+from app.model_quiz.config_model import INPUT_PATH, QG_TEMPLATE, T5_GEN_CONFIG
+from app.model_quiz.data_model import load_dataset
+from app.model_quiz.loaders_model import configure_threads, load_t5, load_grammar, load_qa, load_sbert
+from app.model_quiz.qa_model import BatchedQA
+
+MODELS = ("t5", "grammar", "qa", "sbert")
+PRECISIONS = ("fp32", "int8", "onnx")
+
+
+def seq2seq(tok, mdl, dev, inputs, **gen):
+    import torch
+    enc = tok(inputs, return_tensors="pt", truncation=True, padding=True, max_length=256).to(dev)
+    with torch.inference_mode():
+        out = mdl.generate(**enc, **gen)
+    return tok.batch_decode(out, skip_special_tokens=True)
+
+
+def runner(model, precision):
+    """(fn(batch) -> outputs) for one model at one precision."""
+    if model == "t5":
+        tok, mdl, dev = load_t5(precision)
+        return lambda b: seq2seq(tok, mdl, dev, [QG_TEMPLATE.format(goal=q["goal"], context=q["context"], answer=q["correct_answer"]) for q in b], **T5_GEN_CONFIG)
+    if model == "grammar":
+        tok, mdl = load_grammar(precision)
+        _, _, dev = load_t5()
+        return lambda b: seq2seq(tok, mdl, dev, ["gec: " + q["question"] for q in b], num_beams=2, early_stopping=True, max_length=128)
+    if model == "qa":
+        engines = [BatchedQA(tok, mdl, dev) for tok, mdl, dev in load_qa(precision)]
+        return lambda b: [a for e in engines for a in e([q["question"] for q in b], [q["context"] for q in b])[0]]
+    encoder = load_sbert(precision)
+    return lambda b: list(encoder.encode([q["correct_answer"] for q in b], convert_to_numpy=True, normalize_embeddings=True))
+
+
+def agreement(model, reference, outputs):
+    if model == "sbert":
+        return float(np.mean([float(np.dot(r, o)) for r, o in zip(reference, outputs)]))
+    return sum(r == o for r, o in zip(reference, outputs)) / max(1, len(reference))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-model precision comparison.")
+    parser.add_argument("--items", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--models", nargs="*", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--precisions", nargs="*", default=list(PRECISIONS), choices=PRECISIONS)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    items = load_dataset(INPUT_PATH)
+    sample = random.Random(args.seed).sample(items, min(args.items, len(items)))
+    sample = [{k: str(q.get(k, "")).strip() for k in ("goal", "context", "question", "correct_answer")} for q in sample]
+    batches = [sample[i:i + args.batch_size] for i in range(0, len(sample), args.batch_size)]
+
+    print(f"{len(sample)} items, batch size {args.batch_size}")
+    print(f"{'model':>8} {'precision':>9} {'agree':>7} {'p50 ms':>9} {'p95 ms':>9} {'load s':>7}")
+    for model in args.models:
+        reference = None
+        for precision in ["fp32"] + [p for p in args.precisions if p != "fp32"]:
+            start = time.perf_counter()
+            fn = runner(model, precision)
+            load = time.perf_counter() - start
+            fn(batches[0])  # warm-up
+
+            outputs, times = [], []
+            for batch in batches:
+                start = time.perf_counter()
+                outputs.extend(fn(batch))
+                times.append(time.perf_counter() - start)
+            if reference is None:
+                reference = outputs
+            if precision not in args.precisions:
+                continue
+
+            times.sort()
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            print(f"{model:>8} {precision:>9} {agreement(model, reference, outputs):7.3f} "
+                  f"{statistics.median(times) * 1000:9.1f} {p95 * 1000:9.1f} {load:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare per-request latency of the batched QA stage against the
+original one-pipeline-call-per-question loop.
+
+    python -m benchmarks.bench_qa --num-questions 5 --requests 20
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from transformers import pipeline
+
+from app.model_quiz.config_model import INPUT_PATH, QA_MODEL_PATHS, QA_THRESHOLD
+from app.model_quiz.data_model import load_dataset
+from app.model_quiz.loaders_model import load_qa
+from app.model_quiz.qa_model import BatchedQA
+
+
+def loop_qa(pipes, contexts, questions, originals):
+    final = []
+    for ctx, q, orig in zip(contexts, questions, originals):
+        best, best_score = orig, 0.0
+        for model in pipes:
+            output = model(question=q, context=ctx)
+            if output["score"] > best_score:
+                best, best_score = output["answer"], output["score"]
+        final.append(best if best_score > QA_THRESHOLD else orig)
+    return final
+
+
+def batched_qa(engines, contexts, questions, originals):
+    best, best_score = list(originals), [0.0] * len(originals)
+    for engine in engines:
+        answers, scores = engine(questions, contexts)
+        for i, (a, s) in enumerate(zip(answers, scores)):
+            if s > best_score[i]:
+                best[i], best_score[i] = a, float(s)
+    return [b if s > QA_THRESHOLD else o for b, s, o in zip(best, best_score, originals)]
+
+
+def timed(fn, batches):
+    times, outputs = [], []
+    for contexts, questions, originals in batches:
+        start = time.perf_counter()
+        outputs.append(fn(contexts, questions, originals))
+        times.append(time.perf_counter() - start)
+    return times, outputs
+
+
+def report(name, times):
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+    print(f"{name:>8}: mean {statistics.mean(times) * 1000:8.1f} ms   p50 {statistics.median(times) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--num-questions", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    items = load_dataset(INPUT_PATH)
+    batches = []
+    for _ in range(args.requests):
+        sample = rng.sample(items, args.num_questions)
+        batches.append((
+            [q["context"].strip() for q in sample],
+            [q["question"].strip() for q in sample],
+            [q["correct_answer"].strip() for q in sample],
+        ))
+
+    pipes = [pipeline("question-answering", model=p, tokenizer=p, local_files_only=True) for p in QA_MODEL_PATHS.values()]
+    engines = [BatchedQA(tok, mdl, dev) for tok, mdl, dev in load_qa()]
+
+    # warm both paths once so lazy init does not skew the first request
+    loop_qa(pipes, *batches[0])
+    batched_qa(engines, *batches[0])
+
+    loop_times, loop_out = timed(lambda *b: loop_qa(pipes, *b), batches)
+    batch_times, batch_out = timed(lambda *b: batched_qa(engines, *b), batches)
+
+    total = sum(len(o) for o in loop_out)
+    same = sum(a == b for lo, bo in zip(loop_out, batch_out) for a, b in zip(lo, bo))
+    print(f"{args.requests} requests x {args.num_questions} questions")
+    report("loop", loop_times)
+    report("batched", batch_times)
+    print(f"speedup (p50): {statistics.median(loop_times) / statistics.median(batch_times):.2f}x")
+    print(f"answer agreement: {same}/{total}")
+
+
+if __name__ == "__main__":
+    main()
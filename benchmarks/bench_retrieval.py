@@ -0,0 +1,98 @@
+"""Recall vs latency of the hybrid (TF-IDF + IVF dense) retrieval backend.
+
+For each sampled query, the reference ranking is the exact hybrid score
+(every row scanned densely). The IVF index is then swept over nprobe and
+recall@k against that reference is reported together with per-query
+scoring latency. The plain TF-IDF matcher is timed as the baseline.
+
+    python -m benchmarks.bench_retrieval --queries 200 --k 10
+"""
+
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+
+from app.retrieval_quiz.retrieval_config import CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger
+from app.retrieval_quiz.question_matcher import QuestionMatcher
+from app.retrieval_quiz.dense_matcher import DenseMatcher
+
+
+def topk(scores, k):
+    k = min(k, len(scores))
+    return set(np.argpartition(-scores, k - 1)[:k].tolist())
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hybrid retrieval recall/latency benchmark.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tfidf = QuestionMatcher(CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger)
+    hybrid = DenseMatcher(CONFIG, DATA_DIR, RETRIEVAL_GOALS, logger)
+
+    queries = []
+    for _ in range(args.queries):
+        key = rng.choice(list(hybrid.partitions))
+        part = hybrid.partitions[key]
+        i = rng.randrange(len(part))
+        topics = part.topics[i] if part.topics else part.bank[i].get("question", "").lower().split()
+        queries.append((key, list(topics) or [key]))
+
+    # reference: exact dense scan fused with TF-IDF
+    reference, exact_times = [], []
+    for key, topics in queries:
+        part = hybrid.partitions[key]
+        rows = np.arange(len(part))
+        q = hybrid._encode_one(" ".join(topics))
+
+        def exact():
+            sparse = QuestionMatcher.score(hybrid, part, rows, [topics])[:, 0]
+            return (1 - hybrid.alpha) * sparse + hybrid.alpha * (part.dense.vectors[rows] @ q)
+
+        scores, t = timed(exact)
+        reference.append(topk(scores, args.k))
+        exact_times.append(t)
+
+    tfidf_times, tfidf_overlap = [], []
+    for (key, topics), ref in zip(queries, reference):
+        part = tfidf.partitions[key]
+        scores, t = timed(lambda: tfidf.score(part, np.arange(len(part)), [topics])[:, 0])
+        tfidf_times.append(t)
+        tfidf_overlap.append(len(topk(scores, args.k) & ref) / len(ref))
+
+    print(f"{len(queries)} queries, recall@{args.k} against exact hybrid ranking")
+    print(f"{'backend':>16} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8}")
+
+    def row(name, recall, times):
+        times = sorted(times)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(f"{name:>16} {recall:8.3f} {statistics.median(times) * 1000:8.3f} {p95 * 1000:8.3f}")
+
+    row("tfidf", statistics.mean(tfidf_overlap), tfidf_times)
+    row("hybrid exact", 1.0, exact_times)
+    for nprobe in args.nprobe:
+        hybrid.nprobe = nprobe
+        recalls, times = [], []
+        for (key, topics), ref in zip(queries, reference):
+            part = hybrid.partitions[key]
+            scores, t = timed(lambda: hybrid.score(part, np.arange(len(part)), [topics])[:, 0])
+            times.append(t)
+            recalls.append(len(topk(scores, args.k) & ref) / len(ref))
+        row(f"ivf nprobe={nprobe}", statistics.mean(recalls), times)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Cold-import cost of the API.
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter,
+reports the total and the heaviest third-party packages, and optionally
+checks the total against a saved baseline so heavy imports creeping back
+onto the import path fail loudly.
+
+    python -m benchmarks.bench_startup --top 15
+    python -m benchmarks.bench_startup --save-baseline cache/startup.json
+    python -m benchmarks.bench_startup --baseline cache/startup.json --tolerance 0.25
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+
+    # a package's outermost import has the largest cumulative time, which
+    # covers everything that package pulled in
+    total, packages = 0, {}
+    own = module.split(".")[0]
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if not m:
+            continue
+        _, cumulative, name = m.groups()
+        cumulative = int(cumulative)
+        if name == module:
+            total = cumulative
+        package = name.split(".")[0]
+        if package != own:
+            packages[package] = max(packages.get(package, 0), cumulative)
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API cold-import benchmark.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    total_ms = statistics.median(total for total, _ in runs) / 1000
+    heaviest = sorted(runs[-1][1].items(), key=lambda kv: -kv[1])[: args.top]
+
+    report = {
+        "module": args.module,
+        "total_ms": round(total_ms, 1),
+        "top": [{"module": name, "ms": round(us / 1000, 1)} for name, us in heaviest],
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        limit = baseline["total_ms"] * (1 + args.tolerance)
+        if total_ms > limit:
+            print(f"REGRESSION: import took {total_ms:.1f} ms, baseline {baseline['total_ms']:.1f} ms (limit {limit:.1f} ms)")
+            sys.exit(1)
+        print(f"OK: {total_ms:.1f} ms within {args.tolerance:.0%} of baseline {baseline['total_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
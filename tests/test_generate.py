@@ -1,4 +1,5 @@
 import pytest
+import json
 import time
 from fastapi.testclient import TestClient
 from app.main import app
@@ -53,6 +54,16 @@ def test_generate_correct_structure_and_count(num_q):
         if elapsed > 1.5:
             pytest.warns(None, f"⚠️ Response took {elapsed:.2f}s (expected < 1.5s)")
 
+@pytest.mark.parametrize("difficulty", ["beginner", "intermediate", "advanced"])
+def test_generate_returns_normalized_difficulty_and_type(difficulty):
+    # source files mix "advance"/"advanced" and "MCQ"/"short answer"
+    payload = {"goal": VALID_GOAL, "difficulty": difficulty, "num_questions": 3}
+    r = client.post("/generate", json=payload)
+    assert r.status_code == 200, r.text
+    for q in r.json()["questions"]:
+        assert q["difficulty"] == difficulty
+        assert q["type"] in SUPPORTED_TYPES
+
 # ────────────────────────────────
 # 2. Invalid num_questions → 422
 # ────────────────────────────────
@@ -100,3 +111,652 @@ def test_invalid_difficulty_returns_400():
 def test_missing_fields_returns_422(payload):
     r = client.post("/generate", json=payload)
     assert r.status_code == 422
+
+# ────────────────────────────────
+# 5. Inference timing headers
+# ────────────────────────────────
+
+def test_generate_reports_queue_and_service_time():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 1}
+    r = client.post("/generate", json=payload)
+    assert r.status_code == 200, r.text
+    assert "X-Process-Time" in r.headers
+    assert int(r.headers["X-Queue-Depth"]) >= 0
+    assert r.headers["X-Service-Time"].endswith("s")
+
+# ────────────────────────────────
+# 6. Batch generation (NDJSON)
+# ────────────────────────────────
+
+def test_generate_batch_streams_one_line_per_quiz():
+    payload = {"quizzes": [
+        {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 2},
+        {"goal": VALID_GOAL, "difficulty": "intermediate", "num_questions": 3},
+    ]}
+    r = client.post("/generate/batch", json=payload)
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in r.text.splitlines() if line]
+    assert sorted(d["index"] for d in lines) == [0, 1]
+    for d in lines:
+        spec = payload["quizzes"][d["index"]]
+        assert d["goal"] == spec["goal"]
+        assert d["difficulty"] == spec["difficulty"]
+        assert 0 < len(d["questions"]) <= spec["num_questions"]
+
+
+def test_generate_batch_rejects_unsupported_goal():
+    payload = {"quizzes": [{"goal": "NotAGoal", "difficulty": VALID_DIFFICULTY}]}
+    r = client.post("/generate/batch", json=payload)
+    assert r.status_code == 400
+
+# ────────────────────────────────
+# 7. Streaming generation
+# ────────────────────────────────
+
+def test_generate_stream_ndjson():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 3}
+    r = client.post("/generate/stream", json=payload)
+    assert r.status_code == 200, r.text
+    items = [json.loads(line) for line in r.text.splitlines() if line]
+    assert 0 < len(items) <= 3
+    assert all(q["type"] in SUPPORTED_TYPES for q in items)
+
+
+def test_generate_stream_sse():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 2}
+    r = client.post("/generate/stream", json=payload, headers={"Accept": "text/event-stream"})
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = [line[len("event: "):] for line in r.text.splitlines() if line.startswith("event: ")]
+    assert events[-1] == "done"
+    assert 0 < events.count("question") <= 2
+
+# ────────────────────────────────
+# 8. Metrics and Server-Timing
+# ────────────────────────────────
+
+def test_server_timing_is_opt_in():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 2}
+    assert "server-timing" not in client.post("/generate", json=payload).headers
+    r = client.post("/generate", json=payload, headers={"X-Server-Timing": "1"})
+    assert r.status_code == 200, r.text
+    assert "total;dur=" in r.headers["server-timing"]
+
+
+def test_metrics_exposes_stage_histograms():
+    client.post("/generate", json={"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 2})
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE quiz_stage_seconds histogram" in r.text
+    assert "quiz_inference_inflight" in r.text
+
+
+def test_process_executor_ships_worker_stages():
+    import asyncio
+    from app import metrics
+    from app.executor import InferenceExecutor
+
+    executor = InferenceExecutor(1, 1, "process")
+
+    async def job():
+        token = metrics.start_trace()
+        await executor.run(metrics.observe_stage, "worker_probe", 0.25)
+        return metrics.end_trace(token)
+
+    try:
+        trace = asyncio.run(job())
+    finally:
+        executor.shutdown()
+    assert ("worker_probe", 0.25) in trace
+    assert 'quiz_stage_seconds_count{stage="worker_probe"} 1' in metrics.render()
+
+def test_admin_reload_requires_configured_token(monkeypatch):
+    from app import main
+
+    monkeypatch.setattr(main.config, "admin_token", None)
+    assert client.post("/admin/reload").status_code == 404
+
+    monkeypatch.setattr(main.config, "admin_token", "secret")
+    assert client.post("/admin/reload").status_code == 403
+    r = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+    assert r.status_code == 200, r.text
+
+
+def test_admin_reload_of_missing_bank_is_not_a_server_error(monkeypatch):
+    from app import main
+
+    def missing(*args):
+        raise FileNotFoundError(2, "No such file or directory", "data/gone.json")
+
+    monkeypatch.setattr(main.config, "admin_token", "secret")
+    monkeypatch.setattr(main, "reload_bank", missing)
+    r = client.post("/admin/reload", headers={"X-Admin-Token": "secret"})
+    assert r.status_code == 404, r.text
+
+# ────────────────────────────────
+# 9. Session no-repeat sampling
+# ────────────────────────────────
+
+def test_session_does_not_repeat_questions():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": DEFAULT_NUM, "session_id": f"test-{time.time()}"}
+    seen = []
+    for _ in range(2):
+        r = client.post("/generate", json=payload)
+        assert r.status_code == 200, r.text
+        seen.append({q["question"] for q in r.json()["questions"]})
+    assert seen[0] and not seen[0] & seen[1]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_concurrent_session_draws_do_not_overlap(tmp_path, backend):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.sessions import open_store, sample_unserved
+
+    store = open_store({"backend": backend, "path": str(tmp_path / "sessions.sqlite")})
+
+    def draw(_):
+        def pick(served):
+            rows, wrapped = sample_unserved(64, 4, served)
+            time.sleep(0.005)  # widen the window between read and mark
+            return rows, rows, wrapped
+        return store.draw("s", "scope", 1, pick)
+
+    with ThreadPoolExecutor(8) as pool:
+        drawn = [r for rows in pool.map(draw, range(16)) for r in rows]
+    assert sorted(drawn) == list(range(64))
+
+
+def test_undelivered_session_rows_are_released(monkeypatch):
+    from app.model_quiz import quiz_model
+    from app.normalize import normalize_difficulty, normalize_goal
+    from app.sessions import SessionStore
+
+    monkeypatch.setattr(quiz_model, "sessions", SessionStore())
+    monkeypatch.setattr(quiz_model, "bank", None)
+    scope = f"model:{normalize_goal(VALID_GOAL)}|{normalize_difficulty(VALID_DIFFICULTY)}"
+
+    def served():
+        bits = quiz_model.sessions.served("s", scope, quiz_model.dataset.version) or b""
+        return sum(bin(b).count("1") for b in bits)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("model down")
+
+    monkeypatch.setattr(quiz_model, "generate_items", fail)
+    with pytest.raises(RuntimeError):
+        quiz_model.run_model_quiz(VALID_GOAL, VALID_DIFFICULTY, DEFAULT_NUM, "s")
+    assert served() == 0
+
+    # a stream closed after its first question keeps only that one
+    monkeypatch.setattr(quiz_model, "generate_items", lambda goal, contexts, answers, types: (["Q?"] * len(answers), answers))
+    monkeypatch.setattr(quiz_model, "get_distractors", lambda answers, pools: [[] for _ in answers])
+    stream = quiz_model.iter_model_quiz(VALID_GOAL, VALID_DIFFICULTY, DEFAULT_NUM, "s", chunk_size=1)
+    next(stream)
+    stream.close()
+    assert served() == 1
+
+# ────────────────────────────────
+# 10. Seeded generation & response cache
+# ────────────────────────────────
+
+def test_seeded_requests_are_reproducible_and_cached():
+    payload = {"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": DEFAULT_NUM, "seed": 1234}
+    first = client.post("/generate", json=payload)
+    second = client.post("/generate", json=payload)
+    assert first.status_code == second.status_code == 200, first.text
+    assert first.json() == second.json()
+    assert first.headers["etag"] == second.headers["etag"]
+
+    r = client.post("/generate", json=payload, headers={"If-None-Match": first.headers["etag"]})
+    assert r.status_code == 304
+    assert r.headers["etag"] == first.headers["etag"]
+
+
+def test_unseeded_requests_have_no_etag():
+    r = client.post("/generate", json={"goal": VALID_GOAL, "difficulty": VALID_DIFFICULTY, "num_questions": 3})
+    assert r.status_code == 200, r.text
+    assert "etag" not in r.headers
+
+# ────────────────────────────────
+# 11. Readiness
+# ────────────────────────────────
+
+def test_ready_reports_warmup_state():
+    r = client.get("/ready")
+    assert r.status_code in (200, 503)
+    assert r.json()["state"] in ("pending", "warming", "ready", "failed")
+    if r.status_code == 503:
+        assert "retry-after" in r.headers
+
+
+def test_ready_after_warmup():
+    with TestClient(app) as warm:
+        deadline = time.time() + 600
+        while time.time() < deadline:
+            r = warm.get("/ready")
+            if r.json()["state"] in ("ready", "failed"):
+                break
+            time.sleep(0.2)
+        assert r.status_code == 200, r.text
+
+# ────────────────────────────────
+# 12. Bank loading
+# ────────────────────────────────
+
+@pytest.mark.parametrize("fmt", ["json", "jsonl"])
+def test_loader_skips_and_counts_bad_rows(tmp_path, fmt):
+    from app.records import RETRIEVAL_SCHEMA, load_records
+
+    good = {"question": "What is S3?", "answer": "Object storage", "type": "MCQ", "difficulty": "Beginner", "options": ["a", "b"]}
+    rows = [json.dumps(good), '{"question": "broken", ', json.dumps(dict(good, answer="")), json.dumps(dict(good, options="a"))]
+    path = tmp_path / f"bank.{fmt}"
+    path.write_text("[\n" + ",\n".join(rows) + "\n]" if fmt == "json" else "\n".join(rows), encoding="utf-8")
+
+    records, stats = load_records(str(path), RETRIEVAL_SCHEMA)
+    assert stats.loaded == 1 and stats.skipped == 3
+    assert records[0]["type"] == "mcq" and records[0]["difficulty"] == "beginner"
+    assert dict(records[0]) == dict(good, type="mcq", difficulty="beginner")
+
+
+@pytest.mark.parametrize("chunk", [16, 64, 1 << 20])
+def test_loader_streams_the_data_array_of_a_wrapper_object(tmp_path, chunk):
+    from app.records import iter_raw
+
+    rows = [{"question": f"q{i}", "answer": "a" * i} for i in range(20)]
+    meta = {"source": "export", "tags": ["x", "y"], "note": "{[,:]}"}
+    body = json.dumps({"meta": meta, "version": 2, "data": rows}, indent=1)
+    # anything after the array is never read, so even a truncated tail streams
+    path = tmp_path / "bank.json"
+    path.write_text(body[:body.rindex("]") + 1] + ', "trailer": ', encoding="utf-8")
+    assert [v for v, _ in iter_raw(str(path), chunk)] == rows
+
+    path.write_text(json.dumps({"data": rows[:2], "meta": meta}), encoding="utf-8")
+    assert [v for v, _ in iter_raw(str(path), chunk)] == rows[:2]
+    # keys before "data" larger than the record limit: the file is read whole
+    path.write_text(json.dumps({"meta": "m" * 200, "data": rows[:3]}), encoding="utf-8")
+    assert [v for v, _ in iter_raw(str(path), chunk)] == rows[:3]
+
+# ────────────────────────────────
+# 13. Model-mode units (stub models, no weights)
+# ────────────────────────────────
+
+def test_qa_top_k_decode_matches_full_span_search():
+    import numpy as np
+    from app.model_quiz.qa_model import BatchedQA, _softmax
+
+    qa = BatchedQA(None, None, None, max_answer_len=15)
+    rng = np.random.default_rng(0)
+    length = 96
+    p_start, p_end = _softmax(rng.normal(size=(8, length)) * 3), _softmax(rng.normal(size=(8, length)) * 3)
+    span = np.triu(np.ones((length, length), dtype=bool)) & ~np.triu(np.ones((length, length), dtype=bool), k=15)
+    full = (p_start[:, :, None] * p_end[:, None, :] * span).reshape(8, -1)
+
+    starts, ends, scores = qa._decode(p_start, p_end)
+    assert (starts * length + ends == full.argmax(axis=1)).all()
+    assert np.allclose(scores, full.max(axis=1))
+
+
+def test_dataset_store_reloads_only_when_the_file_changes(tmp_path):
+    import os
+    from app.model_quiz.data_model import DatasetStore
+
+    item = {"goal": "AWS Cloud Practitioner", "difficulty": "Beginner", "context": "S3 stores objects.", "correct_answer": "S3"}
+    path = tmp_path / "Model.json"
+    path.write_text(json.dumps([item, dict(item, difficulty="advance")]), encoding="utf-8")
+    store = DatasetStore(str(path))
+
+    version = store.version
+    pool = store.pool("aws cloud practitioner", "BEGINNER")
+    assert len(pool) == 1 and len(store.pool("AWS Cloud Practitioner", "advanced")) == 1
+    assert store.refresh() is False and store.pool("AWS Cloud Practitioner", "beginner") is pool
+
+    path.write_text(json.dumps([item, item, {"goal": "AWS Cloud Practitioner"}]), encoding="utf-8")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert store.version != version
+    assert len(store.pool("AWS Cloud Practitioner", "beginner")) == 2
+    assert store.pool("AWS Cloud Practitioner", "advanced") == []
+    assert store.load_stats.skipped == 1
+
+
+
+class _CountingEncoder:
+    """Stand-in SBERT: one axis per letter, and a log of every string encoded."""
+
+    def __init__(self):
+        self.seen = []
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True):
+        import numpy as np
+        self.seen.extend(texts)
+        vecs = np.array([[t.lower().count(c) + 0.01 for c in "abcdefghijklmnopqrstuvwxyz"] for t in texts], dtype=np.float32)
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_embedding_store_reencodes_only_new_strings(tmp_path):
+    from app.model_quiz.embeddings_model import EmbeddingStore
+
+    items = [{"correct_answer": "aaa", "distractors": ["aab", "zzz", "abb"]}]
+    enc = _CountingEncoder()
+    store = EmbeddingStore(enc, "stub", str(tmp_path))
+    store.sync(items, version=1)
+    assert sorted(enc.seen) == ["aaa", "aab", "abb", "zzz"]
+    assert store.rank(["aaa"], [["zzz", "abb", "aab"]], top_k=2) == [["aab", "abb"]]
+
+    # same strings, new process: served from the fingerprinted file
+    cold = _CountingEncoder()
+    EmbeddingStore(cold, "stub", str(tmp_path)).sync(items, version=1)
+    assert cold.seen == []
+
+    # a changed dataset encodes only the difference; a reader holding the old
+    # snapshot keeps a consistent (matrix, index) pair
+    before = store._snapshot
+    enc.seen.clear()
+    store.sync(items + [{"correct_answer": "ccc", "distractors": ["aaa"]}], version=2)
+    assert enc.seen == ["ccc"]
+    assert store._snapshot is not before and "ccc" not in before[1]
+    assert len(before[0]) == len(before[1]) == 4
+    assert store.index["ccc"] == 4 and len(store.matrix) == 5
+    # the superseded cache file is pruned; the held snapshot stays readable
+    assert len(list(tmp_path.glob("sbert-*.npy"))) == 1
+    assert float(before[0][before[1]["aaa"]] @ store.matrix[store.index["aaa"]]) > 0.99
+    # the encoder path is part of the fingerprint
+    other = _CountingEncoder()
+    EmbeddingStore(other, "other", str(tmp_path)).sync(items, version=1)
+    assert len(other.seen) == 4
+
+
+
+def test_micro_batcher_flushes_on_size_and_timeout():
+    from app.model_quiz.batching_model import MicroBatcher
+
+    def fn(items):
+        return [x * 10 for x in items]
+
+    # a full batch flushes without waiting for the (long) window
+    batcher = MicroBatcher(fn, window_ms=10_000, max_batch_size=4, name="test-size")
+    start = time.monotonic()
+    assert batcher([1, 2, 3, 4]) == [10, 20, 30, 40]
+    assert time.monotonic() - start < 1
+
+    # a lone short call flushes when the window closes
+    batcher = MicroBatcher(fn, window_ms=50, max_batch_size=100, name="test-timeout")
+    start = time.monotonic()
+    assert batcher([5]) == [50]
+    assert 0.04 <= time.monotonic() - start < 2
+
+
+def test_micro_batcher_routes_slices_and_errors_to_each_caller():
+    from concurrent.futures import ThreadPoolExecutor
+    from app.model_quiz.batching_model import MicroBatcher
+
+    sizes = []
+
+    def fn(items):
+        sizes.append(len(items))
+        if "boom" in items:
+            raise ValueError("boom")
+        return [s.upper() for s in items]
+
+    batcher = MicroBatcher(fn, window_ms=200, max_batch_size=1000, name="test-route")
+    requests = [[f"r{i}-{j}" for j in range(i % 3 + 1)] for i in range(12)]
+    with ThreadPoolExecutor(12) as pool:
+        results = list(pool.map(batcher, requests))
+    assert results == [[s.upper() for s in r] for r in requests]
+    assert sum(sizes) == sum(map(len, requests)) and len(sizes) < len(requests)
+
+    futures = [batcher.submit(["ok"]), batcher.submit(["boom"])]
+    for f in futures:
+        with pytest.raises(ValueError):
+            f.result(5)
+    assert batcher.submit([]).result() == []
+
+
+
+def test_generation_cache_lru_and_sqlite_round_trip(tmp_path):
+    from app.model_quiz.cache_model import GenerationCache
+
+    db = str(tmp_path / "gen.sqlite")
+    cache = GenerationCache("ns-1", max_size=2, path=db)
+    k1, k2, k3 = (cache.key("goal", f"ctx {i}", "ans", "mcq") for i in range(3))
+    assert cache.key("goal", "ctx 0", "ans", "short_answer") != k1
+    assert GenerationCache("ns-2").key("goal", "ctx 0", "ans", "mcq") != k1
+
+    cache.put_many({k1: ("q1", "a1"), k2: ("q2", "a2")})
+    assert cache.get_many([k1]) == [("q1", "a1")]  # k1 becomes most recent
+    cache.put_many({k3: ("q3", "a3")})
+    assert set(cache._mem) == {k1, k3}
+    assert cache.stats()["size"] == 2
+
+    # the evicted entry is still on disk, and a restart sees everything
+    assert cache.get_many([k2, "nope"]) == [("q2", "a2"), None]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+    fresh = GenerationCache("ns-1", max_size=8, path=db)
+    assert fresh.get_many([k1, k2, k3]) == [("q1", "a1"), ("q2", "a2"), ("q3", "a3")]
+    assert fresh.stats()["hit_rate"] == 1.0
+
+    # the table keeps only the most recently written max_rows entries
+    capped = GenerationCache("ns-1", max_size=8, path=db, max_rows=2)
+    capped.put_many({k1: ("q1", "a1b")})
+    count, = capped._db.execute("SELECT COUNT(*) FROM generations").fetchone()
+    assert count == 2
+    assert GenerationCache("ns-1", path=db).get_many([k1, k2, k3]) == [("q1", "a1b"), None, ("q3", "a3")]
+
+
+
+def test_length_buckets_return_outputs_in_input_order():
+    from app.model_quiz import inference_model as im
+
+    assert im.buckets([5, 1, 9, 2, 10], max_size=2, ratio=2.0) == [[1, 3], [0, 2], [4]]
+    lengths = [7, 3, 30, 4, 28, 3, 8, 31]
+    seen = []
+
+    def run(rows):
+        seen.append(rows)
+        width = max(lengths[i] for i in rows)
+        return [f"out-{i}" for i in rows], width * len(rows)
+
+    out = im.run_bucketed("test-bucketed", lengths, run)
+    assert out == [f"out-{i}" for i in range(len(lengths))]
+    assert sorted(i for rows in seen for i in rows) == list(range(len(lengths)))
+    assert all(len(rows) <= im.BUCKET_MAX_SIZE for rows in seen)
+    assert all(max(lengths[i] for i in r) <= min(lengths[i] for i in r) * im.BUCKET_LENGTH_RATIO for r in seen)
+    stats = im.token_stats()["test-bucketed"]
+    assert stats["real"] == sum(lengths) and stats["unbucketed"] == 31 * len(lengths)
+    assert stats["real"] <= stats["padded"] < stats["unbucketed"]
+    assert 'quiz_padding_efficiency_count{model="test-bucketed"} 1' in client.get("/metrics").text
+    assert im.run_bucketed("test-bucketed", [], run) == []
+
+
+# ────────────────────────────────
+# 14. Retrieval index (small synthetic banks, no spaCy)
+# ────────────────────────────────
+
+TERMS = ["lambda", "bucket", "subnet", "queue", "stream", "cache", "table", "shard", "gateway", "volume", "policy", "region"]
+
+
+def _bank_rows(goal, n, seed=0, terms=TERMS):
+    import random
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        a, b, c = rng.sample(terms, 3)
+        rows.append({
+            "goal": goal, "topic": a, "context": f"{a} {b} {c} note {i}", "question": f"How does {a} use {b}?",
+            "answer": f"{a} with {b}", "type": rng.choice(["MCQ", "mcq", "short answer", "Short_Answer"]),
+            "difficulty": rng.choice(["Beginner", "intermediate", "Advance", "advanced"]),
+        })
+    return rows
+
+
+def _matcher(tmp_path, banks, cls=None, **config):
+    import logging
+    from app.normalize import normalize_goal
+    from app.retrieval_quiz.question_matcher import QuestionMatcher
+
+    data = tmp_path / "data"
+    data.mkdir(exist_ok=True)
+    files = {}
+    for goal, rows in banks.items():
+        files[goal] = goal.lower().replace(" ", "_") + ".json"
+        (data / files[goal]).write_text(json.dumps(rows), encoding="utf-8")
+    config = dict({"domain_files": files, "sessions": {"enabled": False}}, **config)
+    return (cls or QuestionMatcher)(config, str(data), {normalize_goal(g) for g in banks}, logging.getLogger("test"))
+
+
+def test_vectorised_match_agrees_with_full_scan_scoring(tmp_path):
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    matcher = _matcher(tmp_path, {"AWS": _bank_rows("AWS", 800)})
+    part = matcher.partition("AWS")
+    topics = ["lambda", "queue"]
+
+    # the pre-vectorisation algorithm: score everything, then filter row by row
+    full = cosine_similarity(part.vectorizer.transform([" ".join(topics)]), part.matrix).ravel()
+    full += [0.2 if any(t in q["topic"] or q["topic"] in t for t in topics) else 0.0 for q in part.bank]
+    wanted = [i for i, q in enumerate(part.bank) if q["difficulty"] == "advanced" and q["type"] == "mcq"]
+
+    rows_ = part.candidates("Advanced", ["MCQ"])
+    assert sorted(rows_.tolist()) == wanted
+    assert np.allclose(part.score(rows_, topics), full[rows_])
+
+    assert len(wanted) > 50
+    picked = matcher.match(topics, "AWS", max_q=50, difficulty="advanced", q_types=["mcq"])
+    best = np.sort(full[wanted])[::-1][:50]
+    assert np.allclose(sorted((q["score"] for q in picked), reverse=True), best)
+
+
+def test_goal_partitions_only_return_their_own_rows(tmp_path):
+    other = ["diode", "transistor", "amplifier", "filter", "signal", "antenna"]
+    matcher = _matcher(tmp_path, {"AWS": _bank_rows("AWS", 60), "GATE ECE": _bank_rows("GATE ECE", 60, seed=1, terms=other)})
+
+    aws, ece = matcher.partition("aws"), matcher.partition("Gate  ECE")
+    assert aws is not ece and len(aws) == len(ece) == 60
+    # each goal fits its own vocabulary
+    assert "lambda" in aws.vectorizer.vocabulary_ and "lambda" not in ece.vectorizer.vocabulary_
+    for topics in (["lambda"], ["diode"]):
+        assert {q["goal"] for q in matcher.match(topics, "AWS", max_q=60)} == {"AWS"}
+        assert {q["goal"] for q in matcher.match(topics, "GATE ECE", max_q=60)} == {"GATE ECE"}
+    assert matcher.match(["lambda"], "Unknown goal") == []
+
+
+def test_persisted_index_reopens_memory_mapped(tmp_path):
+    import os
+    import mmap
+    import numpy as np
+
+    banks = {"AWS": _bank_rows("AWS", 120)}
+    built = _matcher(tmp_path, banks, retrieval_index_dir="index").partition("AWS")
+    index_dir = tmp_path / "index"
+    assert built.source_dir and os.path.dirname(built.source_dir) == str(index_dir)
+    # another goal whose slug extends this one survives a rebuild of "AWS"
+    (index_dir / "aws-extra-v3-0123456789abcdef").mkdir()
+
+    reopened = _matcher(tmp_path, banks, retrieval_index_dir="index").partition("AWS")
+    assert reopened.source_dir == built.source_dir
+    # views into the .npy files, not copies (scipy wraps the memmap in a plain ndarray view)
+    for arr in (reopened.matrix.data, reopened.matrix.indices, reopened.diff_codes):
+        while arr is not None and not isinstance(arr, mmap.mmap):
+            arr = getattr(arr, "base", None)
+        assert arr is not None
+    rows = reopened.candidates("beginner", ["mcq"])
+    assert np.allclose(reopened.score(rows, ["cache", "shard"]), built.score(rows, ["cache", "shard"]))
+
+    # an edited bank gets a new directory; only this goal's old one is pruned
+    edited = _matcher(tmp_path, {"AWS": banks["AWS"][:100]}, retrieval_index_dir="index").partition("AWS")
+    assert len(edited) == 100
+    assert sorted(os.listdir(index_dir)) == sorted(["aws-extra-v3-0123456789abcdef", os.path.basename(edited.source_dir)])
+
+
+class _HashEncoder:
+    """Stand-in sentence encoder: a bag of TERMS, enough to rank by overlap."""
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=64):
+        import numpy as np
+        return np.array([[t.count(term) + 0.01 for term in TERMS] for t in texts], dtype=np.float32)
+
+
+def test_ivf_recall_and_hybrid_fusion(tmp_path):
+    import numpy as np
+    from app.retrieval_quiz.dense_matcher import DenseMatcher, IVFIndex, _normalize
+
+    rng = np.random.default_rng(0)
+    centers = _normalize(rng.normal(size=(20, 32)))
+    vectors = _normalize(centers[rng.integers(0, 20, 2000)] + 0.15 * rng.normal(size=(2000, 32)))
+    index = IVFIndex.build(vectors, nlist=40, seed=0)
+    rows = np.arange(len(vectors))
+    hits = 0
+    for query in _normalize(centers + 0.1 * rng.normal(size=(20, 32))):
+        exact = set(np.argsort(-(vectors @ query))[:10])
+        approx = set(np.argsort(-index.scores(rows, query, nprobe=4))[:10])
+        hits += len(exact & approx)
+    assert hits / 200 >= 0.9
+    # probing every list is exact
+    assert np.allclose(index.scores(rows, vectors[0], nprobe=40), vectors @ vectors[0], atol=1e-6)
+
+    matcher = _matcher(
+        tmp_path, {"AWS": _bank_rows("AWS", 80)}, cls=lambda *a, **k: DenseMatcher(*a, encoder=_HashEncoder(), **k),
+        hybrid={"alpha": 0.5, "nlist": 4, "nprobe": 4},
+    )
+    part = matcher.partition("AWS")
+    rows = part.candidates()
+    dense = _normalize(_HashEncoder().encode([f"{q['context']} {q['question']}" for q in part.bank]))
+    query = _normalize(_HashEncoder().encode(["lambda queue"]))[0]
+    fused = matcher.score(part, rows, [["lambda", "queue"]])[:, 0]
+    assert np.allclose(fused, 0.5 * part.score(rows, ["lambda", "queue"]) + 0.5 * (dense[rows] @ query), atol=1e-5)
+
+
+def test_labels_are_normalised_once_at_load(tmp_path):
+    import random
+    from app.normalize import normalize_difficulty, normalize_type
+
+    assert {normalize_difficulty(d) for d in ("Advance", "ADVANCED", " advanced ")} == {"advanced"}
+    assert {normalize_type(t) for t in ("MCQ", "mcq", "Multiple choice")} == {"mcq"}
+    assert {normalize_type(t) for t in ("short answer", "Short_Answer", "short-answer")} == {"short_answer"}
+
+    matcher = _matcher(tmp_path, {"AWS": _bank_rows("AWS", 200)})
+    part = matcher.partition("AWS")
+    assert {q["difficulty"] for q in part.bank} == {"beginner", "intermediate", "advanced"}
+    assert {q["type"] for q in part.bank} == {"mcq", "short_answer"}
+
+    # any spelling of a filter hits the same (difficulty, type) group
+    rows = part.candidates("advanced", ["mcq"])
+    assert len(rows) and (rows == part.candidates("Advance", ["MCQ"])).all()
+    rng = random.Random(7)
+    seeds = {part.sample("ADVANCED", ["Multiple choice"], rng) for _ in range(50)}
+    assert seeds <= set(rows.tolist())
+    assert part.sample("expert", ["mcq"], rng) is None
+
+
+def test_incremental_reload_and_atomic_refit(tmp_path):
+    import os
+    import numpy as np
+
+    rows = _bank_rows("AWS", 40)
+    matcher = _matcher(tmp_path, {"AWS": rows})
+    old = matcher.partition("AWS")
+    old_vocab = old.vectorizer
+
+    path = tmp_path / "data" / "aws.json"
+    added = [dict(rows[0], question="How does kinesis shard a stream?", context="kinesis shard stream")]
+    path.write_text(json.dumps(rows[1:] + added), encoding="utf-8")
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+
+    summary = matcher.reload_goal("AWS")
+    new = matcher.partition("AWS")
+    assert (summary["added"], summary["removed"], summary["rows"], summary["refit"]) == (1, 1, 40, False)
+    # swapped as a whole: the old partition is untouched and still consistent
+    assert new is not old and len(old) == old.matrix.shape[0] == 40
+    assert new.vectorizer is old_vocab and new.pending == 1
+    assert np.allclose(new.matrix[0].toarray(), old.matrix[1].toarray())
+    assert "kinesis" not in new.vectorizer.vocabulary_
+    assert matcher.reload_goal("AWS")["added"] == 0
+
+    refit = matcher.reload_goal("AWS", refit=True)
+    fitted = matcher.partition("AWS")
+    assert refit["refit"] and fitted is not new and fitted.pending == 0
+    assert "kinesis" in fitted.vectorizer.vocabulary_
+    assert fitted.matrix.shape[0] == len(fitted) == 40